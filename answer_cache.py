@@ -0,0 +1,170 @@
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any
+
+logger = logging.getLogger(__name__)
+
+# 'memory' (per worker), 'sqlite' (shared by all workers on the host) or 'none'.
+ANSWER_CACHE_BACKEND = os.getenv("ANSWER_CACHE_BACKEND", "memory").lower()
+ANSWER_CACHE_PATH = os.getenv("ANSWER_CACHE_PATH", "answer_cache.sqlite3")
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", "3600"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "2000"))
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_question(question: str) -> str:
+    """Case- and whitespace-insensitive form of a question, ignoring trailing punctuation."""
+    return _WHITESPACE_RE.sub(' ', question.strip().lower()).rstrip('?!. ')
+
+
+def answer_key(model_id: str, question: str, formatted_context: str, temperature: float) -> str:
+    context_digest = hashlib.sha256(formatted_context.encode('utf-8')).hexdigest()
+    raw = '\x00'.join([model_id, normalize_question(question), context_digest, repr(float(temperature))])
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class MemoryBackend:
+    """Per-process LRU with TTL."""
+
+    def __init__(self, ttl: int, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key: str, answer: str) -> None:
+        with self._lock:
+            self._entries[key] = (answer, time.time() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteBackend:
+    """SQLite-file LRU with TTL, shared by every worker process that points at the same path."""
+
+    def __init__(self, path: str, ttl: int, max_entries: int):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS answers ("
+                "key TEXT PRIMARY KEY, answer TEXT NOT NULL, expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS answers_accessed ON answers (accessed_at)")
+
+    def _connect(self) -> sqlite3.Connection:
+        # A connection per call keeps this safe across threads and forked workers.
+        return sqlite3.connect(self.path, timeout=5)
+
+    def get(self, key: str) -> str | None:
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute("SELECT answer, expires_at FROM answers WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                conn.execute("DELETE FROM answers WHERE key = ?", (key,))
+                return None
+            conn.execute("UPDATE answers SET accessed_at = ? WHERE key = ?", (now, key))
+            return row[0]
+
+    def set(self, key: str, answer: str) -> None:
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO answers (key, answer, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, answer, now + self.ttl, now),
+            )
+            conn.execute("DELETE FROM answers WHERE expires_at <= ?", (now,))
+            conn.execute(
+                "DELETE FROM answers WHERE key IN (SELECT key FROM answers ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def __len__(self) -> int:
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+
+
+class AnswerCache:
+    """Cache of successful model answers keyed by (model, question, context, temperature).
+
+    Backend errors are logged and treated as misses so the cache can never fail a request.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'stores': 0, 'errors': 0}
+
+    @classmethod
+    def from_env(cls) -> "AnswerCache":
+        if ANSWER_CACHE_BACKEND == 'none':
+            return cls(None)
+        if ANSWER_CACHE_BACKEND == 'sqlite':
+            try:
+                return cls(SQLiteBackend(ANSWER_CACHE_PATH, ANSWER_CACHE_TTL, ANSWER_CACHE_MAX_ENTRIES))
+            except sqlite3.Error as e:
+                logger.warning(f"Could not open answer cache at {ANSWER_CACHE_PATH}: {e}. Falling back to memory.")
+        return cls(MemoryBackend(ANSWER_CACHE_TTL, ANSWER_CACHE_MAX_ENTRIES))
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+
+    def get(self, key: str) -> str | None:
+        if self.backend is None:
+            return None
+        try:
+            answer = self.backend.get(key)
+        except sqlite3.Error as e:
+            logger.warning(f"Answer cache lookup failed: {e}")
+            self._count('errors')
+            return None
+        self._count('hits' if answer is not None else 'misses')
+        return answer
+
+    def set(self, key: str, answer: str) -> None:
+        if self.backend is None:
+            return
+        try:
+            self.backend.set(key, answer)
+            self._count('stores')
+        except sqlite3.Error as e:
+            logger.warning(f"Answer cache store failed: {e}")
+            self._count('errors')
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        stats['backend'] = type(self.backend).__name__ if self.backend is not None else None
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+        return stats
+
+
+answer_cache = AnswerCache.from_env()
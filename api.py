@@ -1,10 +1,19 @@
 import requests
 import json
 import os
-from typing import Dict, Any
+from typing import Dict, Any, Iterator, List, Tuple
 import logging
+import time
 from dotenv import load_dotenv
 
+from answer_cache import answer_cache, answer_key
+from dispatch import LLM_FALLBACK, RETRYABLE_STATUS, ModelCallError, llm_dispatcher
+from http_pool import get_session
+from metrics import model_calls, prompt_chars, prompt_tokens, stage, stage_seconds
+from retrieval import RETRIEVAL_BUDGET_CHARS, select_relevant
+from singleflight import SingleFlight
+from tokens import CHARS_PER_TOKEN, estimate_tokens, truncate_to_tokens
+
 load_dotenv()
 
 logging.basicConfig(level=logging.INFO)
@@ -20,124 +29,416 @@ MODEL_CONFIG = {
     'gemini': {
         'model': 'google/gemini-pro-1.5', # Using a generally available model
         'name': 'Gemini',
-        'color': 'blue'
+        'color': 'blue',
+        'context_window': 2000000,
+        'max_output_tokens': 8192,
+        'fallback': 'deepseek' # Tried when this model fails, or hedged against when it is slow
     },
     'deepseek': {
         'model': 'deepseek/deepseek-chat', # Using a generally available model
         'name': 'DeepSeek',
-        'color': 'indigo'
+        'color': 'indigo',
+        'context_window': 64000,
+        'max_output_tokens': 8192,
+        'fallback': 'gemini'
     },
     'ollama': { # Mapping 'ollama' from frontend
         'model': 'meta-llama/llama-3-8b-instruct:free', # Using a Llama model for Ollama selection
         'name': 'Ollama (Llama 3 8B via OpenRouter)',
-        'color': 'purple'
+        'color': 'purple',
+        'context_window': 8192,
+        'max_output_tokens': 4096,
+        'fallback': 'deepseek'
     }
 }
 
+# Overridable so benchmarks and tests can point at a local stand-in.
+OPENROUTER_API_URL = os.getenv("OPENROUTER_API_URL", "https://openrouter.ai/api/v1/chat/completions")
+
+TEMPERATURE = 0.5
+ANSWER_MAX_TOKENS = 1500 # Requested answer length, clamped to each model's max_output_tokens
+# Upper bound on webpage tokens per prompt, so large-window models aren't billed for whole-page dumps.
+PROMPT_MAX_CONTEXT_TOKENS = int(os.getenv("PROMPT_MAX_CONTEXT_TOKENS", "32000"))
+# Used when no model is given (e.g. format_context called on its own).
+DEFAULT_CONTEXT_TOKENS = 12000
+PROMPT_SAFETY_TOKENS = 256
+
+SYSTEM_PROMPT = "You are an AI assistant. Your task is to answer questions based *solely* on the provided webpage content. Do not use any external knowledge. If the answer is not found in the content, explicitly say so."
+PROMPT_INSTRUCTIONS = (
+    "Answer the following question based on the provided webpage content. "
+    "If the question cannot be answered using ONLY the provided webpage content, "
+    "state that the information is not found in the provided context.\n\n"
+)
+
+def output_token_limit(model_key: str) -> int:
+    """max_tokens to request from a model."""
+    config = MODEL_CONFIG.get(model_key)
+    return min(ANSWER_MAX_TOKENS, config['max_output_tokens']) if config else ANSWER_MAX_TOKENS
+
+def context_token_budget(model_key: str | None, question: str = '') -> int:
+    """Tokens available for webpage content once the system prompt, question and answer are reserved."""
+    config = MODEL_CONFIG.get(model_key) if model_key else None
+    if not config:
+        return DEFAULT_CONTEXT_TOKENS
+    overhead = estimate_tokens(SYSTEM_PROMPT) + estimate_tokens(PROMPT_INSTRUCTIONS) + estimate_tokens(question) + PROMPT_SAFETY_TOKENS
+    available = config['context_window'] - output_token_limit(model_key) - overhead
+    return max(0, min(available, PROMPT_MAX_CONTEXT_TOKENS))
+
+def context_char_budget(model_key: str | None) -> int:
+    """Extraction budget for parse_content matching what the model's prompt can hold."""
+    return context_token_budget(model_key) * CHARS_PER_TOKEN
+
+llm_flight = SingleFlight('llm')
+
+class OpenRouterError(Exception):
+    """A failed model call. str(e) is the same user-facing message query_openrouter would return."""
+
+def _headers() -> Dict[str, str]:
+    return {
+        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
+        "Content-Type": "application/json",
+        "HTTP-Referer": os.getenv("SITE_URL", "http://localhost:9002"), # Placeholder for site URL
+        "X-Title": os.getenv("APP_NAME", "ZScraper") # Placeholder for app name
+    }
+
+def _build_request(prompt: str, context_data: Dict[str, Any], model_key: str) -> Tuple[Dict[str, str], Dict[str, Any], str]:
+    """Build the OpenRouter headers, chat payload and answer-cache key for a question."""
+    with stage('format_context'):
+        formatted_web_content = format_context(context_data, question=prompt, model_key=model_key)
+    
+    full_prompt = (
+        PROMPT_INSTRUCTIONS +
+        f"Webpage content:\n{formatted_web_content}\n\n"
+        f"Question: {prompt}"
+    )
+
+    cache_key = answer_key(MODEL_CONFIG[model_key]['model'], prompt, formatted_web_content, TEMPERATURE)
+    
+    headers = _headers()
+    
+    payload = {
+        "model": MODEL_CONFIG[model_key]['model'],
+        "messages": [
+            {
+                "role": "system",
+                "content": SYSTEM_PROMPT
+            },
+            {
+                "role": "user",
+                "content": full_prompt
+            }
+        ],
+        "temperature": TEMPERATURE,
+        "max_tokens": output_token_limit(model_key)
+    }
+    prompt_chars.observe(len(SYSTEM_PROMPT) + len(full_prompt), model=model_key)
+    prompt_tokens.observe(estimate_tokens(SYSTEM_PROMPT) + estimate_tokens(full_prompt), model=model_key)
+    return headers, payload, cache_key
+
 def query_openrouter(prompt: str, context_data: Dict[str, Any], model_key: str) -> str:
-    """Query OpenRouter API with the given prompt and context for a specific model_key."""
+    """Query OpenRouter API with the given prompt and context for a specific model_key.
+
+    Returns the answer, or the user-facing error message if the call fails.
+    """
+    try:
+        return ask_openrouter(prompt, context_data, model_key)
+    except OpenRouterError as e:
+        return str(e)
+
+def ask_openrouter(prompt: str, context_data: Dict[str, Any], model_key: str) -> str:
+    """Like query_openrouter, but raises OpenRouterError instead of returning an error message."""
     if not OPENROUTER_API_KEY:
-        return "Error: OPENROUTER_API_KEY is not configured in the backend."
+        raise OpenRouterError("Error: OPENROUTER_API_KEY is not configured in the backend.")
 
     try:
         model_key = model_key.lower() # Ensure consistency
         if model_key not in MODEL_CONFIG:
             logger.error(f"Unknown model key: {model_key}")
-            return f"Error: Unknown model '{model_key}' selected."
+            raise OpenRouterError(f"Error: Unknown model '{model_key}' selected.")
         
-        formatted_web_content = format_context(context_data)
-        
-        full_prompt = (
-            "Answer the following question based on the provided webpage content. "
-            "If the question cannot be answered using ONLY the provided webpage content, "
-            "state that the information is not found in the provided context.\n\n"
-            f"Webpage content:\n{formatted_web_content}\n\n"
-            f"Question: {prompt}"
-        )
-        
-        headers = {
-            "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-            "Content-Type": "application/json",
-            "HTTP-Referer": os.getenv("SITE_URL", "http://localhost:9002"), # Placeholder for site URL
-            "X-Title": os.getenv("APP_NAME", "ZScraper") # Placeholder for app name
-        }
-        
-        payload = {
-            "model": MODEL_CONFIG[model_key]['model'],
-            "messages": [
-                {
-                    "role": "system",
-                    "content": "You are an AI assistant. Your task is to answer questions based *solely* on the provided webpage content. Do not use any external knowledge. If the answer is not found in the content, explicitly say so."
-                },
-                {
-                    "role": "user",
-                    "content": full_prompt
-                }
-            ],
-            "temperature": 0.5,
-            "max_tokens": 1500 # Increased slightly for potentially longer answers
-        }
-        
-        logger.info(f"Querying {MODEL_CONFIG[model_key]['name']} (model: {MODEL_CONFIG[model_key]['model']}) with prompt: {prompt[:100]}...")
-        
-        api_url = "https://openrouter.ai/api/v1/chat/completions"
-        response = requests.post(
-            url=api_url,
-            headers=headers,
-            data=json.dumps(payload),
-            timeout=60 # Increased timeout for potentially longer processing
-        )
-        response.raise_for_status() # Will raise HTTPError for bad responses (4xx or 5xx)
-        
-        data = response.json()
-        
-        if data.get('choices') and len(data['choices']) > 0 and data['choices'][0].get('message'):
-            return data['choices'][0]['message']['content']
-        else:
-            logger.error(f"Unexpected response structure from OpenRouter for model {model_key}: {data}")
-            return "Error: Received an unexpected response from the AI model."
-            
-    except requests.exceptions.HTTPError as http_err:
-        logger.error(f"HTTP error occurred for {model_key}: {http_err} - Response: {http_err.response.text}")
-        return f"API Error: Failed to communicate with the AI model ({http_err.response.status_code}). Please try again."
+        headers, payload, cache_key = _build_request(prompt, context_data, model_key)
+    except OpenRouterError:
+        raise
+    except Exception as e:
+        logger.error(f"Error preparing {model_key} request: {type(e).__name__} - {str(e)}")
+        raise OpenRouterError(f"Processing Error: An unexpected error occurred while handling the AI response. {str(e)}")
+
+    def run() -> str:
+        # Checked inside the flight so a worker that waited on another worker's lock finds its answer
+        with stage('answer_cache'):
+            cached_answer = answer_cache.get(cache_key)
+        if cached_answer is not None:
+            logger.info(f"Answer cache hit for {MODEL_CONFIG[model_key]['name']} with prompt: {prompt[:100]}...")
+            return cached_answer
+        return _complete(model_key, headers, payload, cache_key, prompt, context_data)
+
+    # Identical concurrent questions share one in-flight model call (and its error)
+    return llm_flight.do(cache_key, run)
+
+def fallback_model(model_key: str) -> str | None:
+    """The MODEL_CONFIG fallback for model_key, if fallback is enabled and it is a known model."""
+    fallback = MODEL_CONFIG.get(model_key, {}).get('fallback')
+    return fallback if LLM_FALLBACK and fallback in MODEL_CONFIG and fallback != model_key else None
+
+def _retry_after(response: requests.Response) -> float | None:
+    try:
+        return float(response.headers.get('Retry-After', ''))
+    except ValueError:
+        return None # HTTP-date form; the jittered backoff is used instead
+
+def _post(model_key: str, headers: Dict[str, str], payload: Dict[str, Any], timeout: float, stream: bool = False) -> requests.Response:
+    """POST a chat completion over the pooled keep-alive session. Raises ModelCallError on failure."""
+    try:
+        response = get_session(OPENROUTER_API_URL).post(url=OPENROUTER_API_URL, headers=headers, data=json.dumps(payload),
+                                                        timeout=timeout, stream=stream)
     except requests.exceptions.RequestException as e:
         logger.error(f"API request failed for {model_key}: {str(e)}")
-        return f"API Error: Could not connect to the AI model provider. {str(e)}"
+        model_calls.inc(model=model_key, outcome='connection_error')
+        raise ModelCallError(f"API Error: Could not connect to the AI model provider. {str(e)}", retryable=True)
+    if not response.ok:
+        logger.error(f"HTTP error occurred for {model_key}: {response.status_code} - Response: {response.text}")
+        model_calls.inc(model=model_key, outcome='http_error')
+        response.close()
+        raise ModelCallError(f"API Error: Failed to communicate with the AI model ({response.status_code}). Please try again.",
+                             retryable=response.status_code in RETRYABLE_STATUS, retry_after=_retry_after(response))
+    return response
+
+def _answer_from(data: Any) -> str | None:
+    """choices[0].message.content of a chat completion, or None if the response has another shape."""
+    choices = data.get('choices') if isinstance(data, dict) else None
+    if not isinstance(choices, list) or not choices or not isinstance(choices[0], dict):
+        return None
+    message = choices[0].get('message')
+    if not isinstance(message, dict) or not isinstance(message.get('content'), str):
+        return None
+    return message['content']
+
+def _attempt_completion(model_key: str, headers: Dict[str, str], payload: Dict[str, Any], timeout: float) -> str:
+    """One blocking chat completion attempt. Returns the answer or raises ModelCallError."""
+    logger.info(f"Querying {MODEL_CONFIG[model_key]['name']} (model: {MODEL_CONFIG[model_key]['model']})...")
+    with stage('llm'):
+        response = _post(model_key, headers, payload, timeout)
+    try:
+        data = response.json()
+    except ValueError as e:
+        logger.error(f"Error processing {model_key} response: {type(e).__name__} - {str(e)}")
+        model_calls.inc(model=model_key, outcome='bad_response')
+        raise ModelCallError(f"Processing Error: An unexpected error occurred while handling the AI response. {str(e)}")
+
+    answer = _answer_from(data)
+    if answer is not None:
+        model_calls.inc(model=model_key, outcome='ok')
+        return answer
+    logger.error(f"Unexpected response structure from OpenRouter for model {model_key}: {data}")
+    model_calls.inc(model=model_key, outcome='bad_response')
+    # OpenRouter reports some upstream provider failures as a 200 carrying an error object
+    error = data.get('error') if isinstance(data, dict) else None
+    error_code = error.get('code') if isinstance(error, dict) else None
+    raise ModelCallError("Error: Received an unexpected response from the AI model.", retryable=error_code in RETRYABLE_STATUS)
+
+def _complete(model_key: str, headers: Dict[str, str], payload: Dict[str, Any], cache_key: str, prompt: str,
+              context_data: Dict[str, Any]) -> str:
+    """Get an answer through llm_dispatcher (retries, circuit breaker, fallback, hedging).
+
+    Returns the answer, or raises OpenRouterError with the message of the last failed attempt.
+    """
+    requests_by_model = {model_key: (headers, payload, cache_key)}
+
+    def attempt(key: str, timeout: float) -> str:
+        if key not in requests_by_model: # The fallback model gets a prompt sized for its own context window
+            requests_by_model[key] = _build_request(prompt, context_data, key)
+        key_headers, key_payload, _ = requests_by_model[key]
+        return _attempt_completion(key, key_headers, key_payload, timeout)
+
+    logger.info(f"Asking {MODEL_CONFIG[model_key]['name']} with prompt: {prompt[:100]}...")
+    try:
+        answer, answered_by = llm_dispatcher.call(model_key, attempt, fallback_model(model_key))
+    except ModelCallError as e:
+        raise OpenRouterError(e.user_message)
     except Exception as e:
         logger.error(f"Error processing {model_key} response: {type(e).__name__} - {str(e)}")
-        return f"Processing Error: An unexpected error occurred while handling the AI response. {str(e)}"
+        raise OpenRouterError(f"Processing Error: An unexpected error occurred while handling the AI response. {str(e)}")
+
+    if answered_by != model_key:
+        logger.info(f"Answered by fallback model {answered_by} instead of {model_key}")
+    if isinstance(answer, str) and answer.strip():
+        # Only non-empty answers are cached, under the key of the model that wrote it
+        answer_cache.set(requests_by_model[answered_by][2], answer)
+    return answer
+
+def _message_text(message: Dict[str, Any]) -> str:
+    content = message.get('content')
+    if isinstance(content, list): # Multi-part content, e.g. a text part carrying cache_control
+        return ''.join(part.get('text', '') for part in content if isinstance(part, dict))
+    return content or ''
+
+def chat_completion(model_key: str, messages: List[Dict[str, Any]]) -> str:
+    """Send already-built chat messages to model_key and return the answer.
+
+    Used by multi-turn sessions, whose prompt prefix is sized for one model, so calls are
+    retried and circuit-broken but never sent to a fallback model. Raises OpenRouterError.
+    """
+    if not OPENROUTER_API_KEY:
+        raise OpenRouterError("Error: OPENROUTER_API_KEY is not configured in the backend.")
+    if model_key not in MODEL_CONFIG:
+        raise OpenRouterError(f"Error: Unknown model '{model_key}' selected.")
+    payload = {
+        "model": MODEL_CONFIG[model_key]['model'],
+        "messages": messages,
+        "temperature": TEMPERATURE,
+        "max_tokens": output_token_limit(model_key)
+    }
+    prompt_text = ''.join(_message_text(message) for message in messages)
+    prompt_chars.observe(len(prompt_text), model=model_key)
+    prompt_tokens.observe(estimate_tokens(prompt_text), model=model_key)
+    headers = _headers()
+    try:
+        answer = llm_dispatcher.with_retries(model_key, lambda key, timeout: _attempt_completion(key, headers, payload, timeout))
+    except ModelCallError as e:
+        raise OpenRouterError(e.user_message)
+    if not isinstance(answer, str) or not answer.strip():
+        raise OpenRouterError("Error: Received an unexpected response from the AI model.")
+    return answer
+
+def stream_openrouter(prompt: str, context_data: Dict[str, Any], model_key: str) -> Iterator[str]:
+    """Like query_openrouter, but yields the answer in pieces as the model generates them.
+
+    Uses OpenRouter's ``stream: true`` server-sent events. Raises OpenRouterError instead of
+    returning error strings. A cached answer is yielded as a single piece. Opening the stream
+    is retried and circuit-broken like query_openrouter; there is no fallback or hedging,
+    since the answer is already being shown as it arrives.
+    """
+    if not OPENROUTER_API_KEY:
+        raise OpenRouterError("Error: OPENROUTER_API_KEY is not configured in the backend.")
+    model_key = model_key.lower() # Ensure consistency
+    if model_key not in MODEL_CONFIG:
+        logger.error(f"Unknown model key: {model_key}")
+        raise OpenRouterError(f"Error: Unknown model '{model_key}' selected.")
 
-def format_context(context: Dict[str, Any]) -> str:
-    """Format the scraped content into a readable string for AI context"""
+    headers, payload, cache_key = _build_request(prompt, context_data, model_key)
+    cached_answer = answer_cache.get(cache_key)
+    if cached_answer is not None:
+        logger.info(f"Answer cache hit for {MODEL_CONFIG[model_key]['name']} with prompt: {prompt[:100]}...")
+        yield cached_answer
+        return
+    payload["stream"] = True
+
+    logger.info(f"Streaming {MODEL_CONFIG[model_key]['name']} (model: {MODEL_CONFIG[model_key]['model']}) with prompt: {prompt[:100]}...")
+    pieces = []
+    started = time.perf_counter()
+    try:
+        response = llm_dispatcher.with_retries(model_key, lambda key, timeout: _post(key, headers, payload, timeout, stream=True))
+    except ModelCallError as e:
+        stage_seconds.observe(time.perf_counter() - started, stage='llm_stream')
+        raise OpenRouterError(e.user_message)
+    try:
+        with response:
+            response.encoding = 'utf-8' # text/event-stream is UTF-8 by definition
+            for line in response.iter_lines(decode_unicode=True):
+                # Blank lines separate events; lines starting with ':' are keep-alive comments
+                if not line or not line.startswith('data:'):
+                    continue
+                data = line[len('data:'):].strip()
+                if data == '[DONE]':
+                    break
+                chunk = json.loads(data)
+                if chunk.get('error'):
+                    logger.error(f"OpenRouter stream error for {model_key}: {chunk['error']}")
+                    raise OpenRouterError(f"API Error: {chunk['error'].get('message', 'The AI model reported an error.')}")
+                choices = chunk.get('choices') or []
+                delta = (choices[0].get('delta') or {}).get('content') if choices else None
+                if delta:
+                    if not pieces:
+                        stage_seconds.observe(time.perf_counter() - started, stage='llm_first_token')
+                    pieces.append(delta)
+                    yield delta
+    except requests.exceptions.RequestException as e:
+        logger.error(f"API request failed for {model_key}: {str(e)}")
+        raise OpenRouterError(f"API Error: Could not connect to the AI model provider. {str(e)}")
+    except (ValueError, KeyError, AttributeError) as e:
+        logger.error(f"Error processing {model_key} stream: {type(e).__name__} - {str(e)}")
+        raise OpenRouterError(f"Processing Error: An unexpected error occurred while handling the AI response. {str(e)}")
+    finally:
+        # Recorded once the stream ends, so it measures generation time, not time to first token
+        stage_seconds.observe(time.perf_counter() - started, stage='llm_stream')
+
+    answer = ''.join(pieces)
+    if answer.strip():
+        answer_cache.set(cache_key, answer)
+
+def retrieval_token_budget(available: int) -> int:
+    """Tokens question-driven retrieval may select out of `available` context tokens.
+
+    RETRIEVAL_BUDGET_CHARS caps the selection even when the model's window has room for more.
+    """
+    return min(available, RETRIEVAL_BUDGET_CHARS // CHARS_PER_TOKEN)
+
+def format_context(context: Dict[str, Any], question: str | None = None, model_key: str | None = None,
+                   budget: int | None = None) -> str:
+    """Format the scraped content into a readable string for AI context.
+
+    Sections are added in priority order (titles, main text, tables, links) until the
+    model's token budget (or an explicit budget) is full; anything dropped or cut short is
+    logged. With a question, the main text is the chunks most relevant to it (see retrieval.py).
+    """
+    if budget is None:
+        budget = context_token_budget(model_key, question or '')
+    remaining = budget
     formatted_parts = []
-    
+    dropped = []
+
+    def add_lines(header: str, lines: List[str], separator: str, section: str) -> None:
+        nonlocal remaining
+        cost = estimate_tokens(header) + 1
+        if not lines or cost > remaining:
+            if lines:
+                dropped.append(f"{section}: all {len(lines)}")
+            return
+        kept = []
+        for line in lines:
+            line_cost = estimate_tokens(line) + 1
+            if cost + line_cost > remaining:
+                partial = truncate_to_tokens(line, remaining - cost - 1)
+                if partial:
+                    kept.append(partial + "...")
+                    cost += estimate_tokens(partial) + 2
+                dropped.append(f"{section}: {len(lines) - len(kept)} of {len(lines)}" + (" (last one truncated)" if partial else ""))
+                break
+            kept.append(line)
+            cost += line_cost
+        if kept:
+            formatted_parts.append(header + separator.join(kept))
+            remaining -= cost
+
     if context.get('titles'):
-        formatted_parts.append("Titles found on the page:\n" + "\n".join(f"- {title}" for title in context['titles']))
+        add_lines("Titles found on the page:\n", [f"- {title}" for title in context['titles']], "\n", "titles")
     
     if context.get('paragraphs'):
-        formatted_parts.append("Main textual content:\n" + "\n\n".join(context['paragraphs']))
-    
-    if context.get('links'):
-        # Limit the number of links to avoid excessive context
-        limited_links = context['links'][:10]
-        formatted_parts.append("Some links found on the page (text: URL):\n" + "\n".join(
-            f"- {link.get('text', 'N/A')}: {link.get('url', 'N/A')}" for link in limited_links
-        ))
+        paragraphs = context['paragraphs']
+        if question:
+            paragraphs = select_relevant(paragraphs, question, budget=retrieval_token_budget(remaining),
+                                         measure=estimate_tokens)
+        add_lines("Main textual content:\n", paragraphs, "\n\n", "paragraphs")
     
     if context.get('tables'):
-        formatted_parts.append("Tables found on the page:")
-        for i, table in enumerate(context['tables'][:3], 1): # Limit number of tables
-            table_str = [f"Table {i}:"]
+        for i, table in enumerate(context['tables'], 1):
+            table_str = []
             if table.get('headers'):
                 table_str.append("Headers: " + " | ".join(table['headers']))
-            if table.get('rows'):
-                # Limit rows per table
-                for row_idx, row_data in enumerate(table['rows'][:5]):
-                    table_str.append(f"Row {row_idx+1}: " + " | ".join(row_data))
-            formatted_parts.append("\n".join(table_str))
+            for row_idx, row_data in enumerate(table.get('rows', [])):
+                table_str.append(f"Row {row_idx+1}: " + " | ".join(row_data))
+            header = ("Tables found on the page:\n" if i == 1 else "") + f"Table {i}:\n"
+            add_lines(header, table_str, "\n", f"table {i}")
+
+    if context.get('links'):
+        add_lines("Some links found on the page (text: URL):\n", [
+            f"- {link.get('text', 'N/A')}: {link.get('url', 'N/A')}" for link in context['links']
+        ], "\n", "links")
+
+    if dropped:
+        logger.info(f"Context for model '{model_key}' hit its {budget}-token budget; dropped {'; '.join(dropped)}")
             
     if not formatted_parts:
         return "No structured content was extracted from the webpage."
         
     return "\n\n---\n\n".join(formatted_parts)
-
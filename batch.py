@@ -0,0 +1,129 @@
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Iterator, List
+from urllib.parse import urlparse
+
+from api import OpenRouterError, ask_openrouter, context_char_budget
+from service import scrape_and_parse
+
+logger = logging.getLogger(__name__)
+
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "100"))
+# Concurrent model calls (and concurrent page fetches) per batch.
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+# Concurrent fetches per host across all batches in this process.
+BATCH_PER_HOST = int(os.getenv("BATCH_PER_HOST", "2"))
+
+_host_slots: Dict[str, threading.BoundedSemaphore] = {}
+_host_slots_lock = threading.Lock()
+
+
+def _host_slot(url: str) -> threading.BoundedSemaphore:
+    host = urlparse(url if '://' in url else 'https://' + url).netloc.lower()
+    with _host_slots_lock:
+        slot = _host_slots.get(host)
+        if slot is None:
+            slot = _host_slots[host] = threading.BoundedSemaphore(BATCH_PER_HOST)
+        return slot
+
+
+def expand_batch_request(data: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Turn a /ask/batch body into a list of {url, question, model} items.
+
+    Accepts ``items`` (explicit list), or a shorthand with a shared ``model`` and either
+    ``url`` + ``questions`` or ``urls`` + ``question``.
+    """
+    if isinstance(data.get('items'), list):
+        return [item if isinstance(item, dict) else {} for item in data['items']]
+    model_key = data.get('model')
+    if isinstance(data.get('questions'), list):
+        return [{'url': data.get('url'), 'question': question, 'model': model_key} for question in data['questions']]
+    if isinstance(data.get('urls'), list):
+        return [{'url': url, 'question': data.get('question'), 'model': model_key} for url in data['urls']]
+    return []
+
+
+def _item_error(item: Dict[str, Any]) -> str | None:
+    for field, message in (('url', "URL not provided"), ('question', "Question not provided"), ('model', "Model not selected")):
+        value = item.get(field)
+        if not value:
+            return message
+        if not isinstance(value, str) or not value.strip():
+            return f"'{field}' must be a non-empty string"
+    return None
+
+
+def ask_batch(items: List[Dict[str, Any]], concurrency: int = BATCH_CONCURRENCY) -> Iterator[Dict[str, Any]]:
+    """Answer many (url, question, model) items concurrently, yielding results as they complete.
+
+    Each distinct URL and extraction budget is scraped and parsed once; its questions then
+    go to the model in parallel. Every result carries the item's ``index`` (and ``id`` if
+    given) plus either ``answer`` or ``error``; one item failing never stops the others.
+    """
+    started = time.perf_counter()
+    results: "queue.Queue[Dict[str, Any]]" = queue.Queue()
+    groups: Dict[tuple, List[int]] = {}
+
+    def result(index: int, **fields) -> Dict[str, Any]:
+        item = items[index]
+        out = {'index': index, 'url': item.get('url'), 'question': item.get('question'), 'model': item.get('model')}
+        if 'id' in item:
+            out['id'] = item['id']
+        out.update(fields, elapsed_ms=round((time.perf_counter() - started) * 1000))
+        return out
+
+    for index, item in enumerate(items):
+        error = _item_error(item)
+        if error:
+            results.put(result(index, error=error))
+            continue
+        try:
+            model_key = item['model'].lower()
+            groups.setdefault((item['url'], context_char_budget(model_key)), []).append(index)
+        except Exception as e:  # Headers are already sent, so one bad item must not end the stream
+            logger.error(f"Batch item {index} could not be scheduled: {type(e).__name__} - {str(e)}")
+            results.put(result(index, error=f"An internal server error occurred: {str(e)}"))
+
+    scrape_pool = ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(groups))), thread_name_prefix='batch-scrape')
+    llm_pool = ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix='batch-llm')
+
+    def ask(index: int, parsed_data: Dict[str, Any]) -> None:
+        item = items[index]
+        try:
+            results.put(result(index, answer=ask_openrouter(item['question'], parsed_data, str(item['model']).lower())))
+        except OpenRouterError as e:
+            results.put(result(index, error=str(e)))
+        except Exception as e:
+            logger.error(f"Batch item {index} failed: {type(e).__name__} - {str(e)}")
+            results.put(result(index, error=f"An internal server error occurred: {str(e)}"))
+
+    def scrape(url: str, indexes: List[int]) -> None:
+        try:
+            with _host_slot(url):
+                document, parsed_data = scrape_and_parse(url, str(items[indexes[0]]['model']))
+        except Exception as e:
+            logger.error(f"Batch scrape of {url} failed: {type(e).__name__} - {str(e)}")
+            document = parsed_data = None
+        if document is None:
+            for index in indexes:
+                results.put(result(index, error="Failed to scrape the website. The URL might be inaccessible or block scraping."))
+            return
+        for index in indexes:
+            try:
+                llm_pool.submit(ask, index, parsed_data)
+            except RuntimeError:  # Pool shut down because the consumer went away
+                return
+
+    try:
+        for (url, _), indexes in groups.items():
+            scrape_pool.submit(scrape, url, indexes)
+        for _ in range(len(items)):
+            yield results.get()
+    finally:
+        scrape_pool.shutdown(wait=False, cancel_futures=True)
+        llm_pool.shutdown(wait=False, cancel_futures=True)
+        logger.info(f"Batch of {len(items)} items over {len(groups)} pages finished in {time.perf_counter() - started:.2f}s")
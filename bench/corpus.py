@@ -0,0 +1,170 @@
+"""Benchmark corpus: one saved HTML page per page shape the scraper has to cope with.
+
+The pages live in bench/corpus/*.html so every run parses byte-identical input. They are
+synthesised from a fixed seed to mirror the structure (not the text) of real pages of
+each kind; ``python -m bench.corpus`` rewrites them if the generators change.
+"""
+import os
+import random
+from typing import Callable, Dict, List
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'corpus')
+
+_WORDS = (
+    "the of and to in is that for it as with was on be by at this from or have an are which but not "
+    "market policy report city council data system model research school energy water health network "
+    "season players coach budget minister court election storage release version update security users "
+    "analysis growth quarter revenue county transport climate project community museum festival review "
+    "according said would could after before during between while because however although therefore"
+).split()
+
+
+def _sentence(rng: random.Random, words: int) -> str:
+    text = ' '.join(rng.choice(_WORDS) for _ in range(words))
+    return text[0].upper() + text[1:] + '.'
+
+
+def _paragraph(rng: random.Random, sentences: int) -> str:
+    return ' '.join(_sentence(rng, rng.randint(8, 22)) for _ in range(sentences))
+
+
+def small_blog(rng: random.Random) -> str:
+    """A personal blog post: a header, one article of a few paragraphs, a short footer."""
+    body = '\n'.join(f"<p>{_paragraph(rng, rng.randint(3, 6))}</p>" for _ in range(8))
+    return f"""<!DOCTYPE html>
+<html lang="en"><head><meta charset="utf-8"><title>Notes on {_sentence(rng, 4)[:-1]}</title>
+<link rel="stylesheet" href="/style.css"></head>
+<body>
+<header><a href="/">My blog</a> <nav><a href="/about">About</a> <a href="/archive">Archive</a></nav></header>
+<main><article>
+<h1>{_sentence(rng, 6)[:-1]}</h1>
+<p class="meta">Posted on 2024-03-14 by Sam</p>
+{body}
+<h2>{_sentence(rng, 4)[:-1]}</h2>
+<p>{_paragraph(rng, 4)} <a href="/archive/2023">Older posts</a>.</p>
+</article></main>
+<footer><p>&copy; 2024 Sam. Built with a static site generator.</p></footer>
+</body></html>
+"""
+
+
+def news_heavy(rng: random.Random) -> str:
+    """A news front page: big inline scripts and JSON, mega-menu, ads, many teasers, an article."""
+    script = ' '.join(f"window.__cfg{i}={{\"k\":\"{_sentence(rng, 6)}\",\"v\":{rng.randint(0, 99999)}}};" for i in range(400))
+    menu = ''.join(f'<li><a href="/section/{i}">{_sentence(rng, 2)[:-1]}</a></li>' for i in range(150))
+    teasers = []
+    for i in range(120):
+        ad = (f'<div class="advert-slot" id="ad-{i}"><iframe src="https://ads.example/{i}"></iframe>'
+              f'<span>Advertisement</span></div>') if i % 6 == 0 else ''
+        teasers.append(
+            f'<div class="teaser card"><a href="/story/{i}"><img src="/img/{i}.jpg" alt="">'
+            f'<h3>{_sentence(rng, 9)[:-1]}</h3></a><p class="standfirst">{_sentence(rng, 18)}</p>'
+            f'<div class="share-tools"><button>Share</button><button>Save</button></div></div>{ad}'
+        )
+    article = '\n'.join(f"<p>{_paragraph(rng, rng.randint(2, 5))}</p>" for _ in range(40))
+    comments = ''.join(f'<div class="comment"><p>{_sentence(rng, 15)}</p></div>' for _ in range(200))
+    return f"""<!DOCTYPE html>
+<html lang="en"><head><meta charset="utf-8"><title>Daily Example - News, sport and opinion</title>
+<script>{script}</script>
+<style>{'.c{margin:0;padding:0} ' * 500}</style></head>
+<body>
+<div id="cookie-banner" class="cookie-consent"><p>{_paragraph(rng, 3)}</p><button>Accept</button></div>
+<header class="masthead"><nav class="mega-menu"><ul>{menu}</ul></nav></header>
+<div class="page">
+<section class="top-stories">{''.join(teasers[:60])}</section>
+<article class="story">
+<h1>{_sentence(rng, 12)[:-1]}</h1>
+<div class="byline">By Staff Reporter</div>
+<div class="content">{article}</div>
+</article>
+<aside class="sidebar related">{''.join(teasers[60:])}</aside>
+<section class="comments">{comments}</section>
+</div>
+<footer>{menu}</footer>
+<script src="/bundle.js"></script>
+</body></html>
+"""
+
+
+def giant_table(rng: random.Random) -> str:
+    """A data page whose content is one very large table."""
+    header = ''.join(f"<th>{word.title()}</th>" for word in ('id', 'name', 'county', 'category', 'value', 'change', 'updated', 'notes'))
+    rows = []
+    for i in range(3000):
+        rows.append(
+            f"<tr><td>{i}</td><td>{_sentence(rng, 3)[:-1]}</td><td>{rng.choice(_WORDS).title()}</td>"
+            f"<td>{rng.choice(_WORDS)}</td><td>{rng.uniform(0, 1e6):.2f}</td><td>{rng.uniform(-9, 9):+.1f}%</td>"
+            f"<td>2024-0{rng.randint(1, 9)}-1{rng.randint(0, 9)}</td><td>{_sentence(rng, 6)}</td></tr>"
+        )
+    return f"""<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Open data: {_sentence(rng, 4)[:-1]}</title></head>
+<body><main>
+<h1>Dataset export</h1>
+<p>{_paragraph(rng, 3)}</p>
+<table class="data"><thead><tr>{header}</tr></thead><tbody>
+{chr(10).join(rows)}
+</tbody></table>
+</main></body></html>
+"""
+
+
+def spa_shell(rng: random.Random) -> str:
+    """A client-rendered app: an empty mount point and a large framework bundle inlined."""
+    bundle = ';'.join(f"function r{i}(e){{return React.createElement('div',{{key:{i}}},e)}}" for i in range(3000))
+    state = ','.join(f'"item{i}":{{"title":"{_sentence(rng, 5)}","id":{i}}}' for i in range(600))
+    return f"""<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>App</title>
+<link rel="preload" href="/static/js/main.js" as="script"></head>
+<body>
+<noscript>You need to enable JavaScript to run this app.</noscript>
+<div id="root"></div>
+<script>window.__INITIAL_STATE__={{{state}}};</script>
+<script>{bundle}</script>
+</body></html>
+"""
+
+
+def nested_divs(rng: random.Random) -> str:
+    """Page-builder output: text buried under hundreds of levels of wrapper divs."""
+    depth = 400
+    blocks = []
+    for block in range(20):
+        opening = ''.join(f'<div class="wrap w{level}">' for level in range(depth // 20 * (block % 5 + 1)))
+        closing = '</div>' * (depth // 20 * (block % 5 + 1))
+        blocks.append(f"{opening}<h2>{_sentence(rng, 5)[:-1]}</h2><p>{_paragraph(rng, 3)}</p>{closing}")
+    outer = ''.join(f'<div class="section s{level}">' for level in range(depth))
+    return f"""<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>{_sentence(rng, 5)[:-1]}</title></head>
+<body>{outer}<div class="content">{''.join(blocks)}</div>{'</div>' * depth}</body></html>
+"""
+
+
+GENERATORS: Dict[str, Callable[[random.Random], str]] = {
+    'small_blog': small_blog,
+    'news_heavy': news_heavy,
+    'giant_table': giant_table,
+    'spa_shell': spa_shell,
+    'nested_divs': nested_divs,
+}
+
+
+def page_names() -> List[str]:
+    return list(GENERATORS)
+
+
+def load_page(name: str) -> bytes:
+    with open(os.path.join(CORPUS_DIR, f"{name}.html"), 'rb') as f:
+        return f.read()
+
+
+def write_corpus() -> None:
+    os.makedirs(CORPUS_DIR, exist_ok=True)
+    for name, generate in GENERATORS.items():
+        html = generate(random.Random(f"zscraper-bench-{name}"))
+        with open(os.path.join(CORPUS_DIR, f"{name}.html"), 'w', encoding='utf-8', newline='\n') as f:
+            f.write(html)
+        print(f"Wrote {name}.html ({len(html.encode('utf-8')) // 1024} KiB)")
+
+
+if __name__ == '__main__':
+    write_corpus()
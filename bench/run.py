@@ -0,0 +1,193 @@
+"""Offline benchmark of the /ask pipeline over the saved corpus.
+
+    python -m bench.run                                  # run and print a report
+    python -m bench.run --save-baseline bench/baseline.json
+    python -m bench.run --baseline bench/baseline.json   # exit 1 on regression
+
+Stages, timed per corpus page:
+
+- scrape: fetch_document against a local HTTP server (no page cache), including the tree build
+- parse:  parse_content on a fresh Document, so the tree build is included
+- format: format_context for the selected model's budget
+- query:  query_openrouter against a fake OpenRouter with --latency seconds of delay (no answer cache)
+
+Baselines are machine specific; save one on the machine that will check against it.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, Any, List
+
+from bench.corpus import load_page, page_names
+from bench.servers import start_corpus_server, start_fake_openrouter
+
+STAGES = ('scrape', 'parse', 'format', 'query')
+QUESTION = "What are the main points of this page, and which figures does it mention?"
+
+
+def _percentile(samples: List[float], fraction: float) -> float:
+    ordered = sorted(samples)
+    position = (len(ordered) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def measure(fn: Callable[[], Any], iterations: int, warmup: int, size_bytes: int | None) -> Dict[str, float]:
+    """Time fn, then run it once more under tracemalloc for its peak allocation.
+
+    With size_bytes, throughput is also reported as MiB of input HTML per second.
+    """
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    tracemalloc.start()
+    try:
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    mean = statistics.fmean(samples)
+    return {
+        'p50_ms': round(_percentile(samples, 0.5) * 1000, 3),
+        'p95_ms': round(_percentile(samples, 0.95) * 1000, 3),
+        'mean_ms': round(mean * 1000, 3),
+        'ops_per_s': round(1 / mean, 2) if mean else 0.0,
+        'mib_per_s': round(size_bytes / mean / (1024 * 1024), 2) if mean and size_bytes else None,
+        'peak_kib': round(peak / 1024, 1),
+    }
+
+
+def run(pages: List[str], stages: List[str], model_key: str, iterations: int, warmup: int,
+        latency: float) -> Dict[str, Any]:
+    base_url = start_corpus_server()
+    os.environ['OPENROUTER_API_URL'] = start_fake_openrouter(latency)
+    os.environ['OPENROUTER_API_KEY'] = 'bench'
+    # Measure the work itself, not cache hits
+    os.environ['PAGE_CACHE_MAX_BYTES'] = '0'
+    os.environ['PAGE_CACHE_DIR'] = ''
+    os.environ['ANSWER_CACHE_BACKEND'] = 'none'
+
+    # Imported only now: these modules read the environment above at import time
+    from api import context_char_budget, format_context, query_openrouter
+    from parse import parse_content
+    from pipeline import Document
+    from scrape import fetch_document
+
+    char_budget = context_char_budget(model_key)
+    results = {}
+    for name in pages:
+        html_bytes = load_page(name)
+        html = html_bytes.decode('utf-8')
+        url = f"{base_url}/{name}"
+        parsed = parse_content(Document(url, html), max_content_length=char_budget, max_titles=None, max_paragraphs=None)
+        benchmarks = {
+            'scrape': lambda: fetch_document(url, max_content_length=char_budget, max_paragraphs=None),
+            'parse': lambda: parse_content(Document(url, html), max_content_length=char_budget,
+                                           max_titles=None, max_paragraphs=None),
+            'format': lambda: format_context(parsed, question=QUESTION, model_key=model_key),
+            'query': lambda: query_openrouter(QUESTION, parsed, model_key),
+        }
+        for stage_name in stages:
+            html_stage = stage_name in ('scrape', 'parse')
+            result = measure(benchmarks[stage_name], iterations, warmup, len(html_bytes) if html_stage else None)
+            result['page_kib'] = round(len(html_bytes) / 1024, 1)
+            results[f"{name}/{stage_name}"] = result
+            print(f"  {name:<12} {stage_name:<7} p50 {result['p50_ms']:>9.2f} ms", file=sys.stderr)
+
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'model': model_key,
+            'iterations': iterations,
+            'latency_s': latency,
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'results': results,
+    }
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    lines = [f"{'benchmark':<22}{'p50 ms':>10}{'p95 ms':>10}{'ops/s':>10}{'MiB/s':>9}{'peak KiB':>11}"]
+    for key, result in report['results'].items():
+        mib_per_s = f"{result['mib_per_s']:.2f}" if result['mib_per_s'] is not None else '-'
+        lines.append(f"{key:<22}{result['p50_ms']:>10.2f}{result['p95_ms']:>10.2f}{result['ops_per_s']:>10.1f}"
+                     f"{mib_per_s:>9}{result['peak_kib']:>11.1f}")
+    return '\n'.join(lines)
+
+
+def find_regressions(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float,
+                     memory_tolerance: float, slack_ms: float) -> List[str]:
+    """Benchmarks whose p50 or peak memory grew past the baseline by more than the tolerance.
+
+    slack_ms keeps sub-millisecond stages from failing on timer noise.
+    """
+    regressions = []
+    for key, current in report['results'].items():
+        previous = baseline.get('results', {}).get(key)
+        if previous is None:
+            continue
+        time_limit = previous['p50_ms'] * (1 + tolerance) + slack_ms
+        if current['p50_ms'] > time_limit:
+            regressions.append(f"{key}: p50 {current['p50_ms']:.2f} ms vs baseline {previous['p50_ms']:.2f} ms "
+                               f"(limit {time_limit:.2f} ms)")
+        memory_limit = previous['peak_kib'] * (1 + memory_tolerance) + 64
+        if current['peak_kib'] > memory_limit:
+            regressions.append(f"{key}: peak {current['peak_kib']:.0f} KiB vs baseline {previous['peak_kib']:.0f} KiB "
+                               f"(limit {memory_limit:.0f} KiB)")
+    return regressions
+
+
+def main(argv: List[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Offline benchmark of scrape, parse, format and query.")
+    parser.add_argument('--pages', nargs='+', choices=page_names(), default=page_names())
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=list(STAGES))
+    parser.add_argument('--model', default='deepseek', help="MODEL_CONFIG key whose budget is used (default: deepseek)")
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--warmup', type=int, default=2)
+    parser.add_argument('--latency', type=float, default=0.05, help="Fake OpenRouter response delay in seconds")
+    parser.add_argument('--json', metavar='PATH', help="Also write the full report as JSON")
+    parser.add_argument('--save-baseline', metavar='PATH', help="Write this run as the new baseline")
+    parser.add_argument('--baseline', metavar='PATH', help="Compare against a saved baseline; exit 1 on regression")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="Allowed p50 slowdown, as a fraction (default 0.25)")
+    parser.add_argument('--memory-tolerance', type=float, default=0.25, help="Allowed peak memory growth (default 0.25)")
+    parser.add_argument('--slack-ms', type=float, default=0.5, help="Absolute p50 slack added to every limit")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.ERROR)  # The pipeline logs every request at INFO
+    report = run(args.pages, args.stages, args.model, args.iterations, args.warmup, args.latency)
+    print(format_report(report))
+
+    for path in (args.json, args.save_baseline):
+        if path:
+            with open(path, 'w') as f:
+                json.dump(report, f, indent=2)
+                f.write('\n')
+            print(f"Wrote {path}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = find_regressions(report, baseline, args.tolerance, args.memory_tolerance, args.slack_ms)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) against {args.baseline}:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print(f"\nNo regressions against {args.baseline}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
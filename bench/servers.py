@@ -0,0 +1,65 @@
+"""Local stand-ins for the network: a corpus web server and a fake OpenRouter endpoint."""
+import http.server
+import json
+import threading
+import time
+from typing import Dict
+
+from bench.corpus import load_page, page_names
+
+
+class _QuietHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Keep-alive, like real sites behind the pooled sessions
+    disable_nagle_algorithm = True  # Otherwise small responses stall on delayed ACKs
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: bytes, content_type: str, headers: Dict[str, str] | None = None) -> None:
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_corpus_server() -> str:
+    """Serve bench/corpus/<name>.html at /<name> with no caching headers. Returns the base URL."""
+    pages = {f"/{name}": load_page(name) for name in page_names()}
+
+    class Handler(_QuietHandler):
+        def do_GET(self):
+            body = pages.get(self.path)
+            if body is None:
+                self._send(404, b'Not found', 'text/plain')
+            else:
+                self._send(200, body, 'text/html; charset=utf-8', {'Cache-Control': 'no-store'})
+
+    return _serve(Handler)
+
+
+def start_fake_openrouter(latency: float = 0.0) -> str:
+    """A chat-completions endpoint that waits ``latency`` seconds and echoes the prompt size.
+
+    Returns the URL to use as OPENROUTER_API_URL.
+    """
+
+    class Handler(_QuietHandler):
+        def do_POST(self):
+            payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            time.sleep(latency)
+            prompt_chars = sum(len(message.get('content', '')) for message in payload.get('messages', []))
+            answer = f"Benchmark answer from {payload.get('model')} for a {prompt_chars}-character prompt."
+            body = json.dumps({'choices': [{'message': {'role': 'assistant', 'content': answer}}]}).encode('utf-8')
+            self._send(200, body, 'application/json')
+
+    return _serve(Handler) + "/api/v1/chat/completions"
+
+
+def _serve(handler) -> str:
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='bench-server', daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}"
@@ -0,0 +1,364 @@
+import gzip
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import xml.etree.ElementTree as ElementTree
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, Any, List, Tuple
+from urllib.parse import urljoin, urldefrag, urlparse
+
+import requests
+
+from api import context_token_budget, query_openrouter, retrieval_token_budget
+from http_pool import get_session, origin_of
+from parse import parse_content
+from pipeline import Document
+from retrieval import ChunkIndex, content_hash, split_into_chunks
+from robots import robots_cache
+from scrape import DEFAULT_HEADERS, USER_AGENT
+from streaming import read_streamed
+from tokens import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+CRAWL_INDEX_PATH = os.getenv("CRAWL_INDEX_PATH", "crawl_index.sqlite3")
+CRAWL_MAX_PAGES = int(os.getenv("CRAWL_MAX_PAGES", "50"))
+CRAWL_CONCURRENCY = int(os.getenv("CRAWL_CONCURRENCY", "4"))
+# Minimum seconds between requests to the site when robots.txt sets no Crawl-delay.
+CRAWL_DEFAULT_DELAY = float(os.getenv("CRAWL_DEFAULT_DELAY", "0.5"))
+CRAWL_MAX_SITEMAPS = int(os.getenv("CRAWL_MAX_SITEMAPS", "20"))
+CRAWL_PAGE_CHARS = 200000  # Extraction budget per crawled page
+CRAWL_TIMEOUT = 15
+
+SKIPPED_EXTENSIONS = ('.pdf', '.jpg', '.jpeg', '.png', '.gif', '.svg', '.webp', '.ico', '.css', '.js', '.zip',
+                      '.gz', '.tar', '.mp3', '.mp4', '.avi', '.mov', '.woff', '.woff2', '.ttf', '.xml', '.json')
+
+
+class SiteIndex:
+    """Persistent store of crawled pages and their text chunks, keyed by origin."""
+
+    def __init__(self, path: str = CRAWL_INDEX_PATH):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS pages (url TEXT PRIMARY KEY, origin TEXT NOT NULL, etag TEXT, "
+                "last_modified TEXT, content_hash TEXT, links TEXT, fetched_at REAL, changed_at REAL)"
+            )
+            conn.execute("CREATE TABLE IF NOT EXISTS chunks (url TEXT NOT NULL, origin TEXT NOT NULL, position INTEGER, text TEXT)")
+            conn.execute("CREATE INDEX IF NOT EXISTS pages_origin ON pages (origin)")
+            conn.execute("CREATE INDEX IF NOT EXISTS chunks_origin ON chunks (origin)")
+            conn.execute("CREATE INDEX IF NOT EXISTS chunks_url ON chunks (url)")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=10)
+
+    def page(self, url: str) -> Dict[str, Any] | None:
+        with self._connect() as conn:
+            row = conn.execute("SELECT etag, last_modified, content_hash, links FROM pages WHERE url = ?", (url,)).fetchone()
+        if row is None:
+            return None
+        return {'etag': row[0], 'last_modified': row[1], 'content_hash': row[2], 'links': json.loads(row[3] or '[]')}
+
+    def touch_page(self, url: str, etag: str | None, last_modified: str | None) -> None:
+        with self._connect() as conn:
+            conn.execute("UPDATE pages SET fetched_at = ?, etag = COALESCE(?, etag), last_modified = COALESCE(?, last_modified) "
+                         "WHERE url = ?", (time.time(), etag, last_modified, url))
+
+    def replace_page(self, url: str, etag: str | None, last_modified: str | None, digest: str,
+                     links: List[str], chunks: List[str]) -> None:
+        now = time.time()
+        origin = origin_of(url)
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO pages (url, origin, etag, last_modified, content_hash, links, fetched_at, changed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", (url, origin, etag, last_modified, digest, json.dumps(links), now, now)
+            )
+            conn.execute("DELETE FROM chunks WHERE url = ?", (url,))
+            conn.executemany("INSERT INTO chunks (url, origin, position, text) VALUES (?, ?, ?, ?)",
+                             [(url, origin, position, text) for position, text in enumerate(chunks)])
+
+    def site_chunks(self, origin: str) -> List[Tuple[str, str]]:
+        with self._connect() as conn:
+            return conn.execute("SELECT url, text FROM chunks WHERE origin = ? ORDER BY url, position", (origin,)).fetchall()
+
+    def site_version(self, origin: str) -> Tuple[int, float]:
+        """Changes whenever a page of the site is added or its content changes."""
+        with self._connect() as conn:
+            count, changed = conn.execute("SELECT COUNT(*), MAX(changed_at) FROM pages WHERE origin = ?", (origin,)).fetchone()
+        return count, changed or 0.0
+
+    def site_stats(self, origin: str) -> Dict[str, Any]:
+        with self._connect() as conn:
+            pages, last_fetch = conn.execute("SELECT COUNT(*), MAX(fetched_at) FROM pages WHERE origin = ?", (origin,)).fetchone()
+            chunks = conn.execute("SELECT COUNT(*) FROM chunks WHERE origin = ?", (origin,)).fetchone()[0]
+        return {'pages': pages, 'chunks': chunks, 'last_crawled_at': last_fetch}
+
+
+class RateLimiter:
+    """Spaces out request start times by a fixed interval, across threads."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+def _normalize_link(base_url: str, href: str, origin: str) -> str | None:
+    url, _ = urldefrag(urljoin(base_url, href.strip()))
+    parsed = urlparse(url)
+    if parsed.scheme not in ('http', 'https') or origin_of(url) != origin:
+        return None
+    if parsed.path.lower().endswith(SKIPPED_EXTENSIONS):
+        return None
+    return url
+
+
+def same_origin_links(document: Document, origin: str) -> List[str]:
+    links = []
+    seen = set()
+    for anchor in document.soup.find_all('a', href=True):
+        url = _normalize_link(document.url, anchor['href'], origin)
+        if url and url not in seen:
+            seen.add(url)
+            links.append(url)
+    return links
+
+
+def _fetch_sitemap(url: str) -> bytes | None:
+    try:
+        response = get_session(url).get(url, headers=DEFAULT_HEADERS, timeout=CRAWL_TIMEOUT, stream=True)
+        if response.status_code != 200:
+            response.close()
+            return None
+        body = response.raw.read(10 * 1024 * 1024, decode_content=True)
+        response.close()
+    except requests.exceptions.RequestException as e:
+        logger.info(f"Could not fetch sitemap {url}: {e}")
+        return None
+    return gzip.decompress(body) if body[:2] == b'\x1f\x8b' else body
+
+
+def discover_sitemap_urls(origin: str, sitemaps: List[str]) -> List[str]:
+    """Page URLs from the site's sitemaps (following sitemap indexes), same-origin only."""
+    pending = deque(sitemaps or [origin + "/sitemap.xml"])
+    seen_sitemaps = set()
+    pages = []
+    while pending and len(seen_sitemaps) < CRAWL_MAX_SITEMAPS:
+        sitemap_url = pending.popleft()
+        if sitemap_url in seen_sitemaps:
+            continue
+        seen_sitemaps.add(sitemap_url)
+        body = _fetch_sitemap(sitemap_url)
+        if not body:
+            continue
+        try:
+            root = ElementTree.fromstring(body)
+        except (ElementTree.ParseError, OSError) as e:
+            logger.info(f"Could not parse sitemap {sitemap_url}: {e}")
+            continue
+        is_index = root.tag.endswith('sitemapindex')
+        for element in root.iter():
+            if element.tag.endswith('loc') and element.text:
+                loc = element.text.strip()
+                if is_index:
+                    pending.append(loc)
+                else:
+                    normalized = _normalize_link(origin + "/", loc, origin)
+                    if normalized:
+                        pages.append(normalized)
+    return pages
+
+
+class SiteCrawler:
+    """Incrementally crawl one site into a SiteIndex.
+
+    Pages come from the sitemaps and from same-origin links. Each page is fetched
+    conditionally with its stored ETag/Last-Modified. A page that returns 304, or whose
+    extracted text hashes the same as before, keeps its existing chunks.
+    """
+
+    def __init__(self, start_url: str, index: "SiteIndex", max_pages: int = CRAWL_MAX_PAGES,
+                 concurrency: int = CRAWL_CONCURRENCY):
+        if not urlparse(start_url).scheme:
+            start_url = 'https://' + start_url
+        self.start_url = start_url
+        self.origin = origin_of(start_url)
+        self.index = index
+        self.max_pages = max_pages
+        self.concurrency = concurrency
+        self.rules = robots_cache.rules_for(start_url, DEFAULT_HEADERS)
+        delay = self.rules.crawl_delay(USER_AGENT)
+        self.limiter = RateLimiter(delay if delay is not None else CRAWL_DEFAULT_DELAY)
+        self.stats = {'changed': 0, 'unchanged': 0, 'not_modified': 0, 'skipped': 0, 'failed': 0, 'disallowed': 0}
+
+    def crawl(self) -> Dict[str, Any]:
+        started = time.perf_counter()
+        frontier = deque()
+        seen = set()
+        for url in [self.start_url] + discover_sitemap_urls(self.origin, self.rules.sitemaps):
+            if url not in seen:
+                seen.add(url)
+                frontier.append(url)
+        scheduled = 0
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='crawl') as pool:
+            in_flight = set()
+            while frontier or in_flight:
+                while frontier and len(in_flight) < self.concurrency and scheduled < self.max_pages:
+                    in_flight.add(pool.submit(self._crawl_page, frontier.popleft()))
+                    scheduled += 1
+                if not in_flight:
+                    break
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    outcome, links = future.result()
+                    self.stats[outcome] += 1
+                    for link in links:
+                        if link not in seen:
+                            seen.add(link)
+                            frontier.append(link)
+        summary = dict(self.stats, site=self.origin, pages_scheduled=scheduled,
+                       fetched=self.stats['changed'] + self.stats['unchanged'], seconds=round(time.perf_counter() - started, 2), **self.index.site_stats(self.origin))
+        logger.info(f"Crawl of {self.origin} finished: {summary}")
+        return summary
+
+    def _crawl_page(self, url: str) -> Tuple[str, List[str]]:
+        try:
+            return self._index_page(url)
+        except Exception as e:
+            # One bad page (a parser or index error) counts as a failure; the crawl goes on
+            logger.warning(f"Crawl of {url} failed: {type(e).__name__} - {str(e)}", exc_info=True)
+            return 'failed', []
+
+    def _index_page(self, url: str) -> Tuple[str, List[str]]:
+        if not self.rules.can_fetch(USER_AGENT, url):
+            return 'disallowed', []
+        known = self.index.page(url)
+        headers = dict(DEFAULT_HEADERS)
+        if known:
+            if known['etag']:
+                headers['If-None-Match'] = known['etag']
+            if known['last_modified']:
+                headers['If-Modified-Since'] = known['last_modified']
+        self.limiter.wait()
+        try:
+            response = get_session(url).get(url, headers=headers, timeout=CRAWL_TIMEOUT, allow_redirects=True, stream=True)
+            if response.status_code == 304 and known:
+                response.close()
+                self.index.touch_page(url, response.headers.get('ETag'), response.headers.get('Last-Modified'))
+                return 'not_modified', known['links']
+            content_type = response.headers.get('content-type', '').lower()
+            if response.status_code != 200 or 'text/html' not in content_type or origin_of(response.url) != self.origin:
+                response.close()
+                return 'skipped', []
+            body = read_streamed(response, content_type)
+        except requests.exceptions.RequestException as e:
+            logger.info(f"Crawl fetch failed for {url}: {e}")
+            return 'failed', []
+
+        document = Document(url, body.text, content_type)
+        document.record_fetch(body)
+        parsed = parse_content(document, max_content_length=CRAWL_PAGE_CHARS, max_titles=None, max_paragraphs=None)
+        links = same_origin_links(document, self.origin)
+        texts = parsed['titles'][:1] + parsed['paragraphs']
+        digest = content_hash(texts)
+        etag, last_modified = response.headers.get('ETag'), response.headers.get('Last-Modified')
+        if known and known['content_hash'] == digest:
+            self.index.touch_page(url, etag, last_modified)
+            return 'unchanged', links
+        self.index.replace_page(url, etag, last_modified, digest, links, split_into_chunks(parsed['paragraphs']))
+        return 'changed', links
+
+
+_site_index: SiteIndex | None = None
+_site_index_lock = threading.Lock()
+_site_indexes: "OrderedDict[Tuple[str, Tuple[int, float]], ChunkIndex]" = OrderedDict()
+_site_indexes_lock = threading.Lock()
+_active_crawls: Dict[str, threading.Thread] = {}
+_active_crawls_lock = threading.Lock()
+
+
+def get_site_index() -> SiteIndex:
+    """The shared index at CRAWL_INDEX_PATH, opened on first use."""
+    global _site_index
+    with _site_index_lock:
+        if _site_index is None:
+            _site_index = SiteIndex(CRAWL_INDEX_PATH)
+        return _site_index
+
+
+def crawl_site(url: str, max_pages: int = CRAWL_MAX_PAGES) -> Dict[str, Any]:
+    return SiteCrawler(url, get_site_index(), max_pages=max_pages).crawl()
+
+
+def start_crawl(url: str, max_pages: int = CRAWL_MAX_PAGES) -> Tuple[str, bool]:
+    """Crawl in a background thread. Returns (origin, started); one crawl per origin at a time."""
+    origin = origin_of(url if urlparse(url).scheme else 'https://' + url)
+    with _active_crawls_lock:
+        running = _active_crawls.get(origin)
+        if running is not None and running.is_alive():
+            return origin, False
+
+        def run():
+            try:
+                crawl_site(url, max_pages)
+            except Exception as e:
+                logger.error(f"Crawl of {origin} failed: {type(e).__name__} - {str(e)}", exc_info=True)
+
+        thread = threading.Thread(target=run, name=f"crawl-{origin}", daemon=True)
+        _active_crawls[origin] = thread
+        thread.start()
+    return origin, True
+
+
+def crawl_status(url: str) -> Dict[str, Any]:
+    origin = origin_of(url if urlparse(url).scheme else 'https://' + url)
+    with _active_crawls_lock:
+        running = _active_crawls.get(origin)
+        in_progress = running is not None and running.is_alive()
+    return dict(get_site_index().site_stats(origin), site=origin, in_progress=in_progress)
+
+
+def _chunk_index_for(origin: str) -> ChunkIndex | None:
+    site_index = get_site_index()
+    version = site_index.site_version(origin)
+    key = (origin, version)
+    with _site_indexes_lock:
+        index = _site_indexes.get(key)
+        if index is not None:
+            _site_indexes.move_to_end(key)
+            return index
+    rows = site_index.site_chunks(origin)
+    if not rows:
+        return None
+    index = ChunkIndex([f"(Source: {page_url})\n{text}" for page_url, text in rows])
+    with _site_indexes_lock:
+        _site_indexes[key] = index
+        while len(_site_indexes) > 16:
+            _site_indexes.popitem(last=False)
+    return index
+
+
+def ask_site(url: str, question: str, model_key: str) -> str | None:
+    """Answer question from the best-matching chunks across a crawled site. None if the site has no index."""
+    origin = origin_of(url if urlparse(url).scheme else 'https://' + url)
+    index = _chunk_index_for(origin)
+    if index is None:
+        return None
+    # Selected at the budget format_context retrieves to, so it passes these chunks through as they are
+    budget = retrieval_token_budget(context_token_budget(model_key.lower(), question))
+    chunks = index.select(question, budget, measure=estimate_tokens)
+    logger.info(f"Answering from {len(chunks)} of {len(index.chunks)} chunks indexed for {origin}")
+    return query_openrouter(question, {'titles': [], 'paragraphs': chunks}, model_key.lower())
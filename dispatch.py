@@ -0,0 +1,231 @@
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Any, Tuple, TypeVar
+
+logger = logging.getLogger(__name__)
+
+LLM_MAX_ATTEMPTS = int(os.getenv("LLM_MAX_ATTEMPTS", "3"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "8"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+# Total time one model may spend on attempts and backoff before giving up (or falling back).
+LLM_DEADLINE = float(os.getenv("LLM_DEADLINE", "90"))
+# Seconds to wait for the primary model before also asking its fallback. 0 disables hedging.
+LLM_HEDGE_AFTER = float(os.getenv("LLM_HEDGE_AFTER", "0"))
+LLM_BREAKER_THRESHOLD = int(os.getenv("LLM_BREAKER_THRESHOLD", "5"))
+LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))
+# Threads shared by every hedged call in the process; losing hedges keep theirs until they finish.
+LLM_DISPATCH_WORKERS = int(os.getenv("LLM_DISPATCH_WORKERS", "16"))
+# Whether a failed (or circuit-broken) model falls back to its MODEL_CONFIG 'fallback'.
+LLM_FALLBACK = os.getenv("LLM_FALLBACK", "true").lower() == "true"
+
+RETRYABLE_STATUS = frozenset([408, 429, 500, 502, 503, 504])
+
+T = TypeVar('T')
+
+
+class ModelCallError(Exception):
+    """One failed model attempt. user_message is the user-facing error message for the failure."""
+
+    def __init__(self, user_message: str, retryable: bool = False, retry_after: float | None = None):
+        super().__init__(user_message)
+        self.user_message = user_message
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(ModelCallError):
+    def __init__(self, model_key: str):
+        super().__init__(f"API Error: The AI model '{model_key}' is temporarily unavailable. Please try again shortly.")
+
+
+class CircuitBreaker:
+    """Opens after `threshold` consecutive failures; after `cooldown` lets one trial call through."""
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, name: str, threshold: int = LLM_BREAKER_THRESHOLD, cooldown: float = LLM_BREAKER_COOLDOWN):
+        self.name = name
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.cooldown:
+                self.state = self.HALF_OPEN  # This caller is the trial; others stay rejected until it reports
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.threshold:
+                if self.state != self.OPEN:
+                    logger.warning(f"Circuit for {self.name} opened after {self.failures} consecutive failures")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+class Dispatcher:
+    """Retries, per-model circuit breakers, fallback and hedging for model calls.
+
+    An attempt is a callable ``(model_key, timeout) -> result`` that raises ModelCallError.
+    Retryable failures (429, 5xx, timeouts, connection errors) are retried with full-jitter
+    exponential backoff, honouring Retry-After. When the primary model fails or its circuit
+    is open, the fallback model is tried. With hedging, the fallback is also started once
+    the primary has been running for ``hedge_after`` seconds, and the first answer wins.
+    """
+
+    def __init__(self, max_attempts: int = LLM_MAX_ATTEMPTS, backoff_base: float = LLM_BACKOFF_BASE,
+                 backoff_max: float = LLM_BACKOFF_MAX, timeout: float = LLM_TIMEOUT, deadline: float = LLM_DEADLINE,
+                 hedge_after: float = LLM_HEDGE_AFTER, workers: int = LLM_DISPATCH_WORKERS):
+        self.max_attempts = max(1, max_attempts)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.deadline = deadline
+        self.hedge_after = hedge_after
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._executor = ThreadPoolExecutor(max_workers=max(2, workers), thread_name_prefix='llm-dispatch')
+        self._lock = threading.Lock()
+        self._stats = {'calls': 0, 'attempts': 0, 'retries': 0, 'failures': 0, 'circuit_rejections': 0,
+                       'fallbacks': 0, 'fallback_successes': 0, 'hedges': 0, 'hedge_wins': 0}
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+
+    def breaker(self, model_key: str) -> CircuitBreaker:
+        with self._lock:
+            breaker = self._breakers.get(model_key)
+            if breaker is None:
+                breaker = self._breakers[model_key] = CircuitBreaker(model_key)
+            return breaker
+
+    def backoff(self, retry: int, retry_after: float | None = None) -> float:
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** retry))
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.backoff_max))
+        return delay
+
+    def with_retries(self, model_key: str, attempt: Callable[[str, float], T]) -> T:
+        """Run attempt against one model, retrying retryable failures within the deadline."""
+        breaker = self.breaker(model_key)
+        if not breaker.allow():
+            self._count('circuit_rejections')
+            raise CircuitOpenError(model_key)
+        deadline = time.monotonic() + self.deadline
+        for attempt_number in range(self.max_attempts):
+            self._count('attempts')
+            try:
+                result = attempt(model_key, max(1.0, min(self.timeout, deadline - time.monotonic())))
+            except BaseException as e:
+                if not isinstance(e, ModelCallError):
+                    # Unexpected errors still settle the breaker; otherwise a half-open trial that
+                    # raised would leave the circuit half-open, rejecting every call, forever.
+                    breaker.record_failure()
+                    self._count('failures')
+                    raise
+                if e.retryable:
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()  # The provider answered; the request itself was bad
+                delay = self.backoff(attempt_number, e.retry_after)
+                last_try = attempt_number + 1 >= self.max_attempts or time.monotonic() + delay >= deadline
+                if not e.retryable or last_try:
+                    self._count('failures')
+                    raise
+                logger.info(f"Retrying {model_key} in {delay:.2f}s after: {e.user_message}")
+                self._count('retries')
+                time.sleep(delay)
+                if not breaker.allow():
+                    self._count('circuit_rejections')
+                    raise CircuitOpenError(model_key)
+                continue
+            breaker.record_success()
+            return result
+        raise AssertionError("unreachable")
+
+    def call(self, model_key: str, attempt: Callable[[str, float], T], fallback_key: str | None = None) -> Tuple[T, str]:
+        """Answer with model_key or its fallback. Returns (result, model_key that answered)."""
+        self._count('calls')
+        if not fallback_key or fallback_key == model_key:
+            return self.with_retries(model_key, attempt), model_key
+        if self.hedge_after > 0:
+            return self._hedged(model_key, attempt, fallback_key)
+        try:
+            return self.with_retries(model_key, attempt), model_key
+        except ModelCallError as e:
+            logger.warning(f"{model_key} failed ({e.user_message}); falling back to {fallback_key}")
+            return self._fallback(fallback_key, attempt), fallback_key
+
+    def _fallback(self, fallback_key: str, attempt: Callable[[str, float], T]) -> T:
+        self._count('fallbacks')
+        result = self.with_retries(fallback_key, attempt)
+        self._count('fallback_successes')
+        return result
+
+    def _hedged(self, model_key: str, attempt: Callable[[str, float], T], fallback_key: str) -> Tuple[T, str]:
+        started = threading.Event()
+
+        def run_primary() -> T:
+            started.set()
+            return self.with_retries(model_key, attempt)
+
+        primary = self._executor.submit(run_primary)
+        # Time the hedge from when the primary starts, not from when it was queued behind busy workers
+        started.wait()
+        done, _ = wait([primary], timeout=self.hedge_after)
+        if done and primary.exception() is None:
+            return primary.result(), model_key
+        if done:
+            logger.warning(f"{model_key} failed ({primary.exception()}); falling back to {fallback_key}")
+            return self._fallback(fallback_key, attempt), fallback_key
+
+        logger.info(f"{model_key} has not answered after {self.hedge_after}s; hedging with {fallback_key}")
+        self._count('hedges')
+        hedge = self._executor.submit(self.with_retries, fallback_key, attempt)
+        pending = {primary: model_key, hedge: fallback_key}
+        error = None
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                answered_by = pending.pop(future)
+                if future.exception() is None:
+                    if future is hedge:
+                        self._count('hedge_wins')
+                    # The slower call is left to finish in the background; it cannot be interrupted
+                    return future.result(), answered_by
+                error = future.exception()
+        raise error
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            breakers = {key: breaker.state for key, breaker in self._breakers.items()}
+        calls = stats['calls']
+        stats['retry_rate'] = round(stats['retries'] / stats['attempts'], 4) if stats['attempts'] else 0.0
+        stats['fallback_rate'] = round(stats['fallbacks'] / calls, 4) if calls else 0.0
+        stats['hedge_rate'] = round(stats['hedges'] / calls, 4) if calls else 0.0
+        stats['hedge_win_rate'] = round(stats['hedge_wins'] / stats['hedges'], 4) if stats['hedges'] else 0.0
+        stats['open_circuits'] = sum(1 for state in breakers.values() if state != CircuitBreaker.CLOSED)
+        stats['circuits'] = breakers
+        return stats
+
+
+llm_dispatcher = Dispatcher()
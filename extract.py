@@ -0,0 +1,223 @@
+import logging
+from typing import Dict, Any, List
+
+from bs4 import BeautifulSoup, CData, NavigableString, Tag
+
+logger = logging.getLogger(__name__)
+
+UNWANTED_TAGS = frozenset(['script', 'style', 'nav', 'footer', 'aside', 'iframe', 'noscript', 'header', 'form',
+                           'button', 'input', 'textarea', 'select'])
+# Substrings that mark ads, cookie banners, popups and share widgets in class or id attributes.
+UNWANTED_ATTR_MARKERS = ('advert', 'banner', 'cookie', 'popup', 'social', 'share')
+TITLE_TAGS = frozenset(['h1', 'h2', 'h3', 'h4'])
+PARAGRAPH_TAGS = frozenset(['p', 'div'])
+NON_CONTENT_CLASSES = frozenset(['menu', 'sidebar', 'related'])
+# Candidate main-content containers, in priority order.
+CONTENT_AREA_RULES = ['main', 'article', 'role=main', '.content', '#content', '.post-body', '.entry-content']
+MAX_DIV_DESCENDANTS = 10
+MIN_PARAGRAPH_LENGTH = 50
+MIN_FALLBACK_LINE_LENGTH = 100
+
+_TEXT_TYPES = (NavigableString, CData)  # What get_text() counts; comments, doctypes etc. are skipped
+
+# Indices into a node record.
+_NAME, _FRAG_START, _FRAG_END, _DESCENDANTS, _CHARS, _CLASSES, _PRE, _SUBTREE_END = range(8)
+
+
+def _classes(tag: Tag) -> List[str]:
+    value = tag.attrs.get('class')
+    if value is None:
+        return []
+    return value if isinstance(value, list) else str(value).split()
+
+
+def _is_unwanted(tag: Tag, classes: List[str]) -> bool:
+    if tag.name in UNWANTED_TAGS:
+        return True
+    attrs = tag.attrs
+    if not attrs:
+        return False
+    if attrs.get('aria-hidden') == 'true':
+        return True
+    element_id = attrs.get('id') or ''
+    if not isinstance(element_id, str):
+        element_id = ' '.join(element_id)
+    if element_id == 'ad' or 'ad' in classes:
+        return True
+    for marker in UNWANTED_ATTR_MARKERS:
+        if marker in element_id or any(marker in cls for cls in classes):
+            return True
+    return False
+
+
+def _content_area_rank(tag: Tag, classes: List[str]) -> int | None:
+    name = tag.name
+    if name == 'main':
+        return 0
+    if name == 'article':
+        return 1
+    attrs = tag.attrs
+    if not attrs:
+        return None
+    if attrs.get('role') == 'main':
+        return 2
+    if 'content' in classes:
+        return 3
+    if attrs.get('id') == 'content':
+        return 4
+    if 'post-body' in classes:
+        return 5
+    if 'entry-content' in classes:
+        return 6
+    return None
+
+
+class ContentExtractor:
+    """Extract titles and paragraphs from a parsed tree in a single traversal.
+
+    The walk skips unwanted subtrees instead of decomposing them, collects every visible
+    string once into a flat fragment list, and computes each element's descendant count
+    and text length bottom-up. Candidate text is only joined when it is emitted, and
+    emission stops as soon as the ``max_content_length`` budget is full.
+    """
+
+    def __init__(self, soup: BeautifulSoup, max_content_length: int = 50000,
+                 max_titles: int | None = 5, max_paragraphs: int | None = 10):
+        self.soup = soup
+        self.max_content_length = max_content_length
+        self.max_titles = max_titles
+        self.max_paragraphs = max_paragraphs
+        self.fragments: List[str] = []
+        self.titles: List[list] = []
+        self.candidates: List[list] = []
+        self.content_areas: List[list | None] = [None] * len(CONTENT_AREA_RULES)
+        self.body: list | None = None
+        self.nodes_visited = 0
+        self.nodes_pruned = 0
+
+    def _walk(self) -> None:
+        fragments = self.fragments
+        root = [None, 0, 0, 0, 0, [], -1, 0]
+        open_records = [root]
+        # Stack entries are either a PageElement to visit or a record to close.
+        stack: list = list(reversed(self.soup.contents))
+        pre = 0
+        while stack:
+            item = stack.pop()
+            if type(item) is list:
+                # Closing an element: finalize and roll its totals up into the parent.
+                record = open_records.pop()
+                record[_FRAG_END] = len(fragments)
+                record[_SUBTREE_END] = pre
+                parent = open_records[-1]
+                parent[_DESCENDANTS] += 1 + record[_DESCENDANTS]
+                parent[_CHARS] += record[_CHARS]
+                continue
+            if isinstance(item, Tag):
+                self.nodes_visited += 1
+                classes = _classes(item)
+                if _is_unwanted(item, classes):
+                    self.nodes_pruned += 1
+                    continue
+                name = item.name
+                record = [name, len(fragments), 0, 0, 0, classes, pre, 0]
+                pre += 1
+                if name in TITLE_TAGS:
+                    self.titles.append(record)
+                elif name in PARAGRAPH_TAGS:
+                    self.candidates.append(record)
+                elif name == 'body' and self.body is None:
+                    self.body = record
+                rank = _content_area_rank(item, classes)
+                if rank is not None and self.content_areas[rank] is None:
+                    self.content_areas[rank] = record
+                open_records.append(record)
+                stack.append(record)
+                stack.extend(reversed(item.contents))
+            elif type(item) in _TEXT_TYPES:
+                text = item.strip()
+                if text:
+                    fragments.append(text)
+                    open_records[-1][_CHARS] += len(text)
+
+    def _joined_length(self, record: list) -> int:
+        count = record[_FRAG_END] - record[_FRAG_START]
+        return record[_CHARS] + count - 1 if count else 0
+
+    def _text(self, record: list, separator: str = ' ') -> str:
+        return separator.join(self.fragments[record[_FRAG_START]:record[_FRAG_END]])
+
+    def extract(self) -> Dict[str, Any]:
+        self._walk()
+        max_length = self.max_content_length
+        current_total_length = 0
+
+        titles = []
+        for record in self.titles:
+            if self._joined_length(record) == 0:
+                continue
+            text = self._text(record)
+            if current_total_length + len(text) < max_length:
+                titles.append(text)
+                current_total_length += len(text)
+            else:
+                titles.append(text[:max_length - current_total_length] + "...")
+                current_total_length = max_length
+                break
+
+        paragraphs = []
+        content_area = next((area for area in self.content_areas if area is not None), None)
+        for record in self.candidates:
+            if self.max_paragraphs is not None and len(paragraphs) >= self.max_paragraphs:
+                break  # Anything further would be cut by the paragraph limit anyway
+            if content_area is not None and not (content_area[_PRE] < record[_PRE] < content_area[_SUBTREE_END]):
+                continue
+            if record[_NAME] == 'div':
+                if record[_DESCENDANTS] > MAX_DIV_DESCENDANTS or any(cls in NON_CONTENT_CLASSES for cls in record[_CLASSES]):
+                    continue
+            text_length = self._joined_length(record)
+            if text_length > MIN_PARAGRAPH_LENGTH:
+                text = self._text(record)
+                if current_total_length + text_length < max_length:
+                    paragraphs.append(text)
+                    current_total_length += text_length
+                else:
+                    paragraphs.append(text[:max_length - current_total_length] + "...")
+                    current_total_length = max_length
+                    break
+            if current_total_length >= max_length:
+                break
+
+        # If no good paragraphs found, fall back to long lines of the whole page text
+        if not paragraphs and current_total_length < max_length:
+            for fragment in self.fragments:
+                for text in fragment.split('\n'):
+                    if len(text) <= MIN_FALLBACK_LINE_LENGTH:
+                        continue
+                    if current_total_length + len(text) < max_length:
+                        paragraphs.append(text)
+                        current_total_length += len(text)
+                    else:
+                        paragraphs.append(text[:max_length - current_total_length] + "...")
+                        current_total_length = max_length
+                    if current_total_length >= max_length:
+                        break
+                if current_total_length >= max_length:
+                    break
+
+        if not titles and not paragraphs:
+            logger.warning("Could not extract significant titles or paragraphs.")
+            # Fallback to just a snippet of body text if everything else fails
+            body_text = self._text(self.body) if self.body is not None else ""
+            if body_text and (current_total_length + len(body_text) < max_length):
+                paragraphs.append(body_text[:max_length - current_total_length])
+            elif body_text:
+                paragraphs.append(body_text[:max_length - current_total_length] + "..." if current_total_length < max_length else "")
+
+        logger.debug(f"Extractor visited {self.nodes_visited} elements, pruned {self.nodes_pruned} subtrees")
+        return {
+            'titles': titles[:self.max_titles] if self.max_titles is not None else titles,
+            'paragraphs': paragraphs[:self.max_paragraphs] if self.max_paragraphs is not None else paragraphs,
+            'links': [], # Omitting for brevity
+            'tables': []  # Omitting for brevity
+        }
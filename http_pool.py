@@ -0,0 +1,68 @@
+import http.cookiejar
+import logging
+import os
+import threading
+from collections import OrderedDict
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# Keep-alive connections kept open per host, and how many hosts keep a session at all.
+POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "10"))
+POOL_MAX_HOSTS = int(os.getenv("HTTP_POOL_MAX_HOSTS", "64"))
+# When true, callers wait for a free connection instead of opening a throwaway one past POOL_MAXSIZE.
+POOL_BLOCK = os.getenv("HTTP_POOL_BLOCK", "false").lower() == "true"
+
+_sessions: "OrderedDict[str, requests.Session]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def origin_of(url: str) -> str:
+    """Return scheme://host[:port] for url, the key used for pooling and robots.txt."""
+    parsed = urlparse(url)
+    return f"{parsed.scheme.lower()}://{parsed.netloc.lower()}"
+
+
+def _new_session() -> requests.Session:
+    session = requests.Session()
+    # Sessions are shared by every request to an origin, so cookies one scrape receives must
+    # not be replayed on the next; accept none, like the stateless requests.get it replaced.
+    session.cookies.set_policy(http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_MAXSIZE, pool_block=POOL_BLOCK)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def get_session(url: str) -> requests.Session:
+    """Return the shared keep-alive session for url's origin, creating it on first use.
+
+    Sessions are kept in an LRU bounded by POOL_MAX_HOSTS; the least recently used host's
+    session is closed when a new host needs a slot.
+    """
+    key = origin_of(url)
+    evicted = None
+    with _lock:
+        session = _sessions.get(key)
+        if session is not None:
+            _sessions.move_to_end(key)
+            return session
+        session = _new_session()
+        _sessions[key] = session
+        if len(_sessions) > POOL_MAX_HOSTS:
+            evicted_key, evicted = _sessions.popitem(last=False)
+            logger.info(f"Closing pooled HTTP session for {evicted_key}")
+    if evicted is not None:
+        evicted.close()
+    return session
+
+
+def close_all() -> None:
+    with _lock:
+        sessions = list(_sessions.values())
+        _sessions.clear()
+    for session in sessions:
+        session.close()
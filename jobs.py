@@ -0,0 +1,214 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Any
+
+from api import OpenRouterError, ask_openrouter
+from service import scrape_and_parse
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+# Queued plus running jobs per process before POST /ask/jobs answers 429.
+JOB_MAX_PENDING = int(os.getenv("JOB_MAX_PENDING", "32"))
+JOB_RESULT_TTL = int(os.getenv("JOB_RESULT_TTL", "3600"))
+# 'memory' only works with a single gunicorn worker; 'sqlite' lets any worker answer status polls.
+JOB_STORE_BACKEND = os.getenv("JOB_STORE_BACKEND", "memory").lower()
+JOB_STORE_PATH = os.getenv("JOB_STORE_PATH", "jobs.sqlite3")
+
+QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED = 'queued', 'running', 'succeeded', 'failed', 'cancelled'
+FINISHED_STATES = frozenset([SUCCEEDED, FAILED, CANCELLED])
+
+
+class QueueFullError(Exception):
+    """Raised by JobQueue.submit when JOB_MAX_PENDING jobs are already queued or running."""
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class MemoryJobStore:
+    def __init__(self):
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def create(self, job: Dict[str, Any]) -> None:
+        with self._lock:
+            self._jobs[job['id']] = dict(job)
+
+    def get(self, job_id: str) -> Dict[str, Any] | None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def update(self, job_id: str, **fields) -> None:
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id].update(fields, updated_at=time.time())
+
+    def purge_expired(self, now: float) -> int:
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items() if job['expires_at'] and job['expires_at'] <= now]
+            for job_id in expired:
+                del self._jobs[job_id]
+        return len(expired)
+
+
+class SQLiteJobStore:
+    """Job records in a SQLite file, so status polls and cancels work from any worker process."""
+
+    _COLUMNS = ('id', 'status', 'url', 'question', 'model', 'answer', 'error', 'cancel_requested',
+                'created_at', 'updated_at', 'expires_at')
+
+    def __init__(self, path: str):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, status TEXT, url TEXT, question TEXT, model TEXT, "
+                "answer TEXT, error TEXT, cancel_requested INTEGER, created_at REAL, updated_at REAL, expires_at REAL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=5)
+
+    def create(self, job: Dict[str, Any]) -> None:
+        with self._connect() as conn:
+            conn.execute(f"INSERT INTO jobs ({', '.join(self._COLUMNS)}) VALUES ({', '.join('?' * len(self._COLUMNS))})",
+                         [job.get(column) for column in self._COLUMNS])
+
+    def get(self, job_id: str) -> Dict[str, Any] | None:
+        with self._connect() as conn:
+            row = conn.execute(f"SELECT {', '.join(self._COLUMNS)} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(zip(self._COLUMNS, row))
+        job['cancel_requested'] = bool(job['cancel_requested'])
+        return job
+
+    def update(self, job_id: str, **fields) -> None:
+        fields['updated_at'] = time.time()
+        assignments = ', '.join(f"{name} = ?" for name in fields)
+        with self._connect() as conn:
+            conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", [*fields.values(), job_id])
+
+    def purge_expired(self, now: float) -> int:
+        with self._connect() as conn:
+            return conn.execute("DELETE FROM jobs WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,)).rowcount
+
+
+class JobQueue:
+    """Bounded thread pool running the scrape -> parse -> query pipeline for /ask/jobs."""
+
+    def __init__(self, store, workers: int = JOB_WORKERS, max_pending: int = JOB_MAX_PENDING,
+                 result_ttl: int = JOB_RESULT_TTL):
+        self.store = store
+        self.max_pending = max_pending
+        self.result_ttl = result_ttl
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ask-job')
+        self._futures: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "JobQueue":
+        if JOB_STORE_BACKEND == 'sqlite':
+            return cls(SQLiteJobStore(JOB_STORE_PATH))
+        return cls(MemoryJobStore())
+
+    @property
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._futures)
+
+    def submit(self, url: str, question: str, model_key: str) -> Dict[str, Any]:
+        now = time.time()
+        self.store.purge_expired(now)
+        job = {
+            'id': uuid.uuid4().hex, 'status': QUEUED, 'url': url, 'question': question, 'model': model_key,
+            'answer': None, 'error': None, 'cancel_requested': False,
+            'created_at': now, 'updated_at': now, 'expires_at': None,
+        }
+        with self._lock:
+            if len(self._futures) >= self.max_pending:
+                raise QueueFullError(f"{len(self._futures)} jobs already pending")
+            self.store.create(job)
+            future = self._executor.submit(self._run, job['id'], url, question, model_key)
+            self._futures[job['id']] = future
+        future.add_done_callback(lambda _: self._forget(job['id']))
+        return job
+
+    def _forget(self, job_id: str) -> None:
+        with self._lock:
+            self._futures.pop(job_id, None)
+
+    def get(self, job_id: str) -> Dict[str, Any] | None:
+        job = self.store.get(job_id)
+        if job is None or (job['expires_at'] and job['expires_at'] <= time.time()):
+            return None
+        return job
+
+    def cancel(self, job_id: str) -> Dict[str, Any] | None:
+        """Cancel a job. Queued jobs never start; running ones stop at the next stage boundary."""
+        job = self.get(job_id)
+        if job is None or job['status'] in FINISHED_STATES:
+            return job
+        with self._lock:
+            future = self._futures.get(job_id)
+        if future is not None and future.cancel():
+            self._finish(job_id, CANCELLED)
+        else:
+            # Running here or in another worker process; _run checks this flag between stages.
+            self.store.update(job_id, cancel_requested=True)
+        return self.store.get(job_id)
+
+    def _finish(self, job_id: str, status: str, answer: str | None = None, error: str | None = None) -> None:
+        self.store.update(job_id, status=status, answer=answer, error=error, expires_at=time.time() + self.result_ttl)
+
+    def _check_cancelled(self, job_id: str) -> None:
+        job = self.store.get(job_id)
+        if job is None or job['cancel_requested']:
+            raise JobCancelled()
+
+    def _run(self, job_id: str, url: str, question: str, model_key: str) -> None:
+        try:
+            self._check_cancelled(job_id)
+            # A worker that dies mid-job never finishes it; the deadline lets the row expire anyway
+            self.store.update(job_id, status=RUNNING, expires_at=time.time() + self.result_ttl)
+            document, parsed_data = scrape_and_parse(url, model_key)
+            if document is None:
+                self._finish(job_id, FAILED, error="Failed to scrape the website. The URL might be inaccessible or block scraping.")
+                return
+            self._check_cancelled(job_id)
+            try:
+                answer = ask_openrouter(question, parsed_data, model_key.lower())
+            except OpenRouterError as e:
+                self._finish(job_id, FAILED, error=str(e))
+                return
+            self._check_cancelled(job_id)
+            self._finish(job_id, SUCCEEDED, answer=answer)
+        except JobCancelled:
+            logger.info(f"Job {job_id} cancelled")
+            self._finish(job_id, CANCELLED)
+        except Exception as e:
+            logger.error(f"Job {job_id} failed: {type(e).__name__} - {str(e)}", exc_info=True)
+            self._finish(job_id, FAILED, error=f"An internal server error occurred: {str(e)}")
+
+
+def job_to_json(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Public view of a job record for the HTTP API."""
+    view = {'job_id': job['id'], 'status': job['status'], 'created_at': job['created_at']}
+    if job['status'] == SUCCEEDED:
+        view['answer'] = job['answer']
+    if job['error']:
+        view['error'] = job['error']
+    if job['expires_at']:
+        view['expires_at'] = job['expires_at']
+    return view
+
+
+job_queue = JobQueue.from_env()
@@ -1,13 +1,23 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, stream_with_context
+import json
 import logging
 import os
+import time
 from dotenv import load_dotenv
 from flask_cors import CORS # Import CORS
 
 # Import your custom modules
-from scrape import scrape_website
-from parse import parse_content
-from api import query_openrouter
+from api import query_openrouter, stream_openrouter, OpenRouterError, llm_flight
+from service import scrape_and_parse, scrape_flight
+from jobs import job_queue, job_to_json, QueueFullError
+from batch import ask_batch, expand_batch_request, BATCH_CONCURRENCY, BATCH_MAX_ITEMS
+from crawl import ask_site, crawl_status, start_crawl, CRAWL_MAX_PAGES
+from answer_cache import answer_cache
+from page_cache import page_cache
+from robots import robots_cache
+from dispatch import llm_dispatcher
+from sessions import session_manager, session_to_json
+import metrics
 
 load_dotenv()
 
@@ -18,41 +28,99 @@ CORS(app) # Enable CORS for all routes
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+metrics.registry.register_stats('page_cache', page_cache.stats)
+metrics.registry.register_stats('robots_cache', robots_cache.stats)
+metrics.registry.register_stats('answer_cache', answer_cache.stats)
+metrics.registry.register_stats('singleflight_scrape', scrape_flight.stats)
+metrics.registry.register_stats('singleflight_llm', llm_flight.stats)
+metrics.registry.register_stats('llm_dispatch', llm_dispatcher.stats)
+metrics.registry.register_stats('sessions', session_manager.stats)
+metrics.registry.register_stats('jobs', lambda: {'pending': job_queue.pending})
+
+@app.before_request
+def start_request_timing():
+    g.started = time.perf_counter()
+    g.trace_token = metrics.start_trace()
+    g.profiler = None
+    if metrics.PROFILE_REQUESTS and (request.args.get('profile') == '1' or request.headers.get('X-Profile') == '1'):
+        g.profiler = metrics.start_profile()
+
+@app.after_request
+def finish_request_timing(response):
+    """Record request latency and add a Server-Timing header with the pipeline stages.
+
+    Streaming responses (/ask/stream, /ask/batch) do their work after this runs, so their
+    stages only show up in /metrics.
+    """
+    elapsed = time.perf_counter() - g.started
+    trace = metrics.end_trace(g.trace_token)
+    metrics.request_seconds.observe(elapsed, endpoint=request.endpoint or 'unknown', method=request.method,
+                                    status=response.status_code)
+    response.headers['Server-Timing'] = metrics.server_timing(trace, total=elapsed)
+    if g.profiler is not None:
+        profile_path = metrics.finish_profile(g.profiler, request.endpoint or 'unknown')
+        if profile_path:
+            response.headers['X-Profile-File'] = os.path.basename(profile_path)
+    return response
+
 @app.route('/')
 def index():
     return jsonify({"message": "ZScraper Flask AI Backend is running!"})
 
-@app.route('/ask', methods=['POST'])
-def ask_route():
+@app.route('/cache/stats')
+def cache_stats_route():
+    return jsonify({
+        "page_cache": page_cache.stats(),
+        "robots": robots_cache.stats(),
+        "answer_cache": answer_cache.stats(),
+        "singleflight": {"scrape": scrape_flight.stats(), "llm": llm_flight.stats()},
+        "llm_dispatch": llm_dispatcher.stats(),
+    })
+
+@app.route('/metrics')
+def metrics_route():
+    """Prometheus text exposition of stage histograms, byte/prompt sizes and cache stats."""
+    return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4')
+
+def _read_ask_payload():
+    """Validate an /ask-style JSON body. Returns (url, question, model_key, error_response)."""
     data = request.get_json()
     if not data:
-        return jsonify({"error": "Invalid JSON payload"}), 400
+        return None, None, None, (jsonify({"error": "Invalid JSON payload"}), 400)
 
     url = data.get('url')
     question = data.get('question')
     model_key = data.get('model') # e.g., 'gemini', 'ollama', 'deepseek'
 
     if not url:
-        return jsonify({"error": "URL not provided"}), 400
+        return None, None, None, (jsonify({"error": "URL not provided"}), 400)
     if not question:
-        return jsonify({"error": "Question not provided"}), 400
+        return None, None, None, (jsonify({"error": "Question not provided"}), 400)
     if not model_key:
-        return jsonify({"error": "Model not selected"}), 400
+        return None, None, None, (jsonify({"error": "Model not selected"}), 400)
+    return url, question, model_key, None
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.route('/ask', methods=['POST'])
+def ask_route():
+    url, question, model_key, error_response = _read_ask_payload()
+    if error_response:
+        return error_response
 
     logger.info(f"Received /ask request: URL='{url}', Question='{question[:50]}...', Model='{model_key}'")
 
     try:
-        # Step 1: Scrape website
+        # Steps 1 and 2: Scrape website and parse content. Both are shared with concurrent
+        # requests for the same URL, and the extraction budget follows the selected model's
+        # context window (see api.MODEL_CONFIG).
         logger.info(f"Attempting to scrape URL: {url}")
-        html_content = scrape_website(url)
-        if html_content is None:
+        document, parsed_data = scrape_and_parse(url, model_key)
+        if document is None:
             logger.error(f"Failed to scrape website: {url}")
             return jsonify({"error": "Failed to scrape the website. The URL might be inaccessible or block scraping."}), 500
-        logger.info(f"Successfully scraped URL. Content length: {len(html_content)}")
-
-        # Step 2: Parse content
-        logger.info("Parsing scraped HTML content...")
-        parsed_data = parse_content(html_content)
+        logger.info(f"Successfully scraped URL. Content length: {len(document)}")
         if not parsed_data or (not parsed_data.get('paragraphs') and not parsed_data.get('titles')):
              logger.warning(f"Parsing resulted in little to no content for URL: {url}")
         # We proceed even if content is sparse, AI can state that.
@@ -71,6 +139,181 @@ def ask_route():
         logger.error(f"An unexpected error occurred in /ask route: {str(e)}", exc_info=True)
         return jsonify({"error": f"An internal server error occurred: {str(e)}"}), 500
 
+@app.route('/ask/stream', methods=['POST'])
+def ask_stream_route():
+    """Same request body as /ask, answered as Server-Sent Events.
+
+    Emits ``status`` events for each pipeline stage, ``token`` events carrying answer
+    deltas, then ``done``; failures end the stream with an ``error`` event.
+    """
+    url, question, model_key, error_response = _read_ask_payload()
+    if error_response:
+        return error_response
+    model_key = model_key.lower()
+
+    logger.info(f"Received /ask/stream request: URL='{url}', Question='{question[:50]}...', Model='{model_key}'")
+
+    def generate():
+        try:
+            yield _sse("status", {"stage": "scraping", "url": url})
+            document, parsed_data = scrape_and_parse(url, model_key)
+            if document is None:
+                logger.error(f"Failed to scrape website: {url}")
+                yield _sse("error", {"error": "Failed to scrape the website. The URL might be inaccessible or block scraping."})
+                return
+
+            yield _sse("status", {"stage": "parsed", "content_length": len(document)})
+            yield _sse("status", {"stage": "querying", "model": model_key})
+            for delta in stream_openrouter(question, parsed_data, model_key):
+                yield _sse("token", {"delta": delta})
+            yield _sse("done", {})
+        except OpenRouterError as e:
+            yield _sse("error", {"error": str(e)})
+        except Exception as e:
+            logger.error(f"An unexpected error occurred in /ask/stream route: {str(e)}", exc_info=True)
+            yield _sse("error", {"error": f"An internal server error occurred: {str(e)}"})
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route('/ask/batch', methods=['POST'])
+def ask_batch_route():
+    """Answer many questions and/or URLs at once, streaming one NDJSON line per item as it completes."""
+    data = request.get_json()
+    if not data:
+        return jsonify({"error": "Invalid JSON payload"}), 400
+    items = expand_batch_request(data)
+    if not items:
+        return jsonify({"error": "Provide 'items', or 'url' with 'questions', or 'urls' with 'question'"}), 400
+    if len(items) > BATCH_MAX_ITEMS:
+        return jsonify({"error": f"Batch too large ({len(items)} items, maximum {BATCH_MAX_ITEMS})"}), 400
+
+    logger.info(f"Received /ask/batch request with {len(items)} items")
+    concurrency = data.get('concurrency')
+    if not isinstance(concurrency, int) or not 1 <= concurrency <= BATCH_CONCURRENCY:
+        concurrency = BATCH_CONCURRENCY
+
+    def generate():
+        for item_result in ask_batch(items, concurrency=concurrency):
+            yield json.dumps(item_result) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson',
+                    headers={"X-Accel-Buffering": "no"})
+
+@app.route('/crawl', methods=['POST'])
+def crawl_route():
+    """Start (or refresh) a background crawl of a site for /ask/site."""
+    data = request.get_json()
+    if not data or not data.get('url'):
+        return jsonify({"error": "URL not provided"}), 400
+    max_pages = data.get('max_pages')
+    if not isinstance(max_pages, int) or not 1 <= max_pages <= CRAWL_MAX_PAGES:
+        max_pages = CRAWL_MAX_PAGES
+    site, started = start_crawl(data['url'], max_pages)
+    logger.info(f"Crawl of {site} {'started' if started else 'already running'} (max {max_pages} pages)")
+    return jsonify(dict(crawl_status(data['url']), started=started)), 202
+
+@app.route('/crawl/status', methods=['GET'])
+def crawl_status_route():
+    url = request.args.get('url')
+    if not url:
+        return jsonify({"error": "URL not provided"}), 400
+    return jsonify(crawl_status(url))
+
+@app.route('/ask/site', methods=['POST'])
+def ask_site_route():
+    """Like /ask, but answered from the crawled index of the URL's whole site."""
+    url, question, model_key, error_response = _read_ask_payload()
+    if error_response:
+        return error_response
+    logger.info(f"Received /ask/site request: URL='{url}', Question='{question[:50]}...', Model='{model_key}'")
+    try:
+        ai_answer = ask_site(url, question, model_key)
+        if ai_answer is None:
+            return jsonify({"error": "This site has not been crawled yet. POST /crawl first."}), 404
+        return jsonify({"answer": ai_answer})
+    except Exception as e:
+        logger.error(f"An unexpected error occurred in /ask/site route: {str(e)}", exc_info=True)
+        return jsonify({"error": f"An internal server error occurred: {str(e)}"}), 500
+
+@app.route('/ask/jobs', methods=['POST'])
+def create_job_route():
+    """Queue an /ask request and return its job id immediately (202)."""
+    url, question, model_key, error_response = _read_ask_payload()
+    if error_response:
+        return error_response
+    try:
+        job = job_queue.submit(url, question, model_key)
+    except QueueFullError as e:
+        logger.warning(f"Rejecting /ask/jobs request: {e}")
+        return jsonify({"error": "Too many pending jobs. Please retry shortly."}), 429, {"Retry-After": "5"}
+    logger.info(f"Queued job {job['id']}: URL='{url}', Question='{question[:50]}...', Model='{model_key}'")
+    return jsonify(job_to_json(job)), 202, {"Location": f"/ask/jobs/{job['id']}"}
+
+@app.route('/ask/jobs/<job_id>', methods=['GET'])
+def get_job_route(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found or expired"}), 404
+    return jsonify(job_to_json(job))
+
+@app.route('/ask/jobs/<job_id>', methods=['DELETE'])
+def cancel_job_route(job_id):
+    job = job_queue.cancel(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found or expired"}), 404
+    return jsonify(job_to_json(job))
+
+@app.route('/sessions', methods=['POST'])
+def create_session_route():
+    """Scrape a page once and pin its context for follow-up questions via /sessions/<id>/ask."""
+    data = request.get_json()
+    if not data or not data.get('url'):
+        return jsonify({"error": "URL not provided"}), 400
+    if not data.get('model'):
+        return jsonify({"error": "Model not selected"}), 400
+    try:
+        session = session_manager.create(data['url'], data['model'])
+    except ValueError as e:
+        return jsonify({"error": f"Error: {str(e)}"}), 400
+    except Exception as e:
+        logger.error(f"An unexpected error occurred in /sessions route: {str(e)}", exc_info=True)
+        return jsonify({"error": f"An internal server error occurred: {str(e)}"}), 500
+    if session is None:
+        return jsonify({"error": "Failed to scrape the website. The URL might be inaccessible or block scraping."}), 500
+    return jsonify(session_to_json(session)), 201, {"Location": f"/sessions/{session['id']}"}
+
+@app.route('/sessions/<session_id>', methods=['GET'])
+def get_session_route(session_id):
+    session = session_manager.get(session_id)
+    if session is None:
+        return jsonify({"error": "Session not found or expired"}), 404
+    return jsonify(session_to_json(session))
+
+@app.route('/sessions/<session_id>', methods=['DELETE'])
+def delete_session_route(session_id):
+    if not session_manager.delete(session_id):
+        return jsonify({"error": "Session not found or expired"}), 404
+    return jsonify({"session_id": session_id, "deleted": True})
+
+@app.route('/sessions/<session_id>/ask', methods=['POST'])
+def ask_session_route(session_id):
+    data = request.get_json()
+    if not data or not data.get('question'):
+        return jsonify({"error": "Question not provided"}), 400
+    question = data['question']
+    logger.info(f"Received /sessions/{session_id}/ask request: Question='{question[:50]}...'")
+    try:
+        result = session_manager.ask(session_id, question)
+    except OpenRouterError as e:
+        return jsonify({"error": str(e)}), 502
+    except Exception as e:
+        logger.error(f"An unexpected error occurred in /sessions/ask route: {str(e)}", exc_info=True)
+        return jsonify({"error": f"An internal server error occurred: {str(e)}"}), 500
+    if result is None:
+        return jsonify({"error": "Session not found or expired"}), 404
+    return jsonify(result)
+
 if __name__ == '__main__':
     port = int(os.environ.get("PORT", 5000))
     # Set host to '0.0.0.0' to be accessible externally if needed, e.g., in Docker
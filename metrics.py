@@ -0,0 +1,214 @@
+import cProfile
+import io
+import logging
+import math
+import os
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Any, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Per-request cProfile runs; a request opts in with ?profile=1 or an "X-Profile: 1" header.
+PROFILE_REQUESTS = os.getenv("PROFILE_REQUESTS", "false").lower() == "true"
+# Where .prof files are written (open with snakeviz, or pstats). Unset = only log the top functions.
+PROFILE_DIR = os.getenv("PROFILE_DIR") or None
+PROFILE_TOP_FUNCTIONS = 25
+
+SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+BYTES_BUCKETS = tuple(1024 * 4 ** power for power in range(9))  # 1 KiB .. 64 MiB
+SIZE_BUCKETS = (100, 500, 1000, 2000, 4000, 8000, 16000, 32000, 64000, 128000, 256000, 512000)
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus text format."""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = SECONDS_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._series: Dict[Tuple[str, ...], List[float]] = {}  # bucket counts..., sum, count
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            for position, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[position] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                for position, bound in enumerate(self.buckets):
+                    le = f'le="{_format_value(float(bound))}"'
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {series[position]}")
+                labels = _format_labels(self.labelnames, key)
+                lines.append(f"{self.name}_sum{labels} {_format_value(float(series[-2]))}")
+                lines.append(f"{self.name}_count{labels} {series[-1]}")
+        return lines
+
+
+class Registry:
+    """Metrics for /metrics, plus stats() callbacks exported as gauges at scrape time."""
+
+    def __init__(self, prefix: str = 'zscraper'):
+        self.prefix = prefix
+        self._metrics: List[Counter | Histogram] = []
+        self._stats_sources: List[Tuple[str, Callable[[], Dict[str, Any]]]] = []
+
+    def counter(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        metric = Counter(f"{self.prefix}_{name}", documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = SECONDS_BUCKETS) -> Histogram:
+        metric = Histogram(f"{self.prefix}_{name}", documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def register_stats(self, name: str, stats: Callable[[], Dict[str, Any]]) -> None:
+        """Export every numeric field of stats() as a gauge named <prefix>_<name>_<field>."""
+        self._stats_sources.append((name, stats))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for name, stats in self._stats_sources:
+            try:
+                values = stats()
+            except Exception as e:
+                logger.warning(f"Could not collect {name} stats for /metrics: {e}")
+                continue
+            for field, value in values.items():
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                metric_name = f"{self.prefix}_{name}_{field}"
+                lines.append(f"# TYPE {metric_name} gauge")
+                lines.append(f"{metric_name} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+stage_seconds = registry.histogram('stage_duration_seconds', 'Time spent in each /ask pipeline stage.', ('stage',))
+request_seconds = registry.histogram('http_request_duration_seconds', 'HTTP request latency until the response is returned.',
+                                     ('endpoint', 'method', 'status'))
+fetch_bytes = registry.histogram('fetch_bytes', 'Bytes downloaded per page fetch.', buckets=BYTES_BUCKETS)
+content_bytes = registry.histogram('content_bytes', 'Bytes of each fetched page the extractor used.', buckets=BYTES_BUCKETS)
+prompt_chars = registry.histogram('prompt_chars', 'Characters in each prompt sent to a model.', ('model',), SIZE_BUCKETS)
+prompt_tokens = registry.histogram('prompt_tokens', 'Estimated tokens in each prompt sent to a model.', ('model',), SIZE_BUCKETS)
+model_calls = registry.counter('model_calls_total', 'Completed model calls by outcome.', ('model', 'outcome'))
+
+# Stage timings of the current request, for the Server-Timing header. None outside a request.
+_trace: ContextVar[List[Tuple[str, float]] | None] = ContextVar('metrics_trace', default=None)
+
+
+@contextmanager
+def stage(name: str):
+    """Time a block into stage_seconds and, inside a traced request, its Server-Timing header."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        stage_seconds.observe(elapsed, stage=name)
+        trace = _trace.get()
+        if trace is not None:
+            trace.append((name, elapsed))
+
+
+def start_trace():
+    return _trace.set([])
+
+
+def end_trace(token) -> List[Tuple[str, float]]:
+    trace = _trace.get() or []
+    _trace.reset(token)
+    return trace
+
+
+def server_timing(trace: List[Tuple[str, float]], total: float | None = None) -> str:
+    """Render stage timings as a Server-Timing header value, summing repeated stages."""
+    durations: Dict[str, float] = {}
+    for name, elapsed in trace:
+        durations[name] = durations.get(name, 0.0) + elapsed
+    if total is not None:
+        durations['total'] = total
+    return ', '.join(f"{name};dur={elapsed * 1000:.1f}" for name, elapsed in durations.items())
+
+
+def start_profile() -> cProfile.Profile | None:
+    """Profile the calling thread. Work handed to other threads (batch, jobs, crawls) is not included."""
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError as e:  # Another profiler is already active on this thread
+        logger.warning(f"Could not start request profile: {e}")
+        return None
+    return profiler
+
+
+def finish_profile(profiler: cProfile.Profile, label: str) -> str | None:
+    """Stop profiler, log its top functions and, with PROFILE_DIR, save it. Returns the file path."""
+    profiler.disable()
+    output = io.StringIO()
+    pstats.Stats(profiler, stream=output).sort_stats('cumulative').print_stats(PROFILE_TOP_FUNCTIONS)
+    logger.info(f"Profile for {label}:\n{output.getvalue()}")
+    if not PROFILE_DIR:
+        return None
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = os.path.join(PROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{int(time.time() * 1000) % 1000:03d}-{label}.prof")
+    profiler.dump_stats(path)
+    return path
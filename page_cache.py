@@ -0,0 +1,327 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+from typing import Dict, Any, Mapping
+
+logger = logging.getLogger(__name__)
+
+# Used when a response carries no explicit freshness information.
+DEFAULT_HEURISTIC_TTL = int(os.getenv("PAGE_CACHE_DEFAULT_TTL", "300"))
+# Disk usage is tracked per process between directory scans; rescan after this many writes
+# to pick up what other workers wrote (or removed) in the same directory.
+DISK_RESCAN_WRITES = int(os.getenv("PAGE_CACHE_DISK_RESCAN_WRITES", "100"))
+DISK_PRUNE_TARGET = 0.9  # Fraction of disk_max_bytes left after a prune
+
+
+class CachedPage:
+    """A fetched page plus the HTTP metadata needed to decide freshness and revalidate it."""
+
+    def __init__(self, url: str, text: str, content_type: str, etag: str | None = None,
+                 last_modified: str | None = None, expires_at: float = 0.0, stored_at: float | None = None):
+        self.url = url
+        self.text = text
+        self.content_type = content_type
+        self.etag = etag
+        self.last_modified = last_modified
+        self.expires_at = expires_at
+        self.stored_at = stored_at if stored_at is not None else time.time()
+        self.size = len(text.encode('utf-8'))
+
+    def is_fresh(self, now: float | None = None) -> bool:
+        return (now if now is not None else time.time()) < self.expires_at
+
+    def can_revalidate(self) -> bool:
+        return bool(self.etag or self.last_modified)
+
+    def conditional_headers(self) -> Dict[str, str]:
+        """Headers for a conditional GET against the origin."""
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+    def to_meta(self) -> Dict[str, Any]:
+        return {
+            'url': self.url, 'content_type': self.content_type, 'etag': self.etag,
+            'last_modified': self.last_modified, 'expires_at': self.expires_at, 'stored_at': self.stored_at,
+        }
+
+
+def _parse_cache_control(value: str) -> Dict[str, str | None]:
+    directives = {}
+    for part in value.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        name, _, arg = part.partition('=')
+        directives[name.strip().lower()] = arg.strip().strip('"') if arg else None
+    return directives
+
+
+def _parse_http_date(value: str | None) -> float | None:
+    if not value:
+        return None
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+def freshness_lifetime(headers: Mapping[str, str], now: float | None = None) -> float | None:
+    """Seconds the response may be served without revalidation, or None if it must not be stored.
+
+    Follows RFC 9111 for a shared cache: s-maxage, then max-age, then Expires, then a
+    Last-Modified heuristic (10% of the document age) capped at DEFAULT_HEURISTIC_TTL.
+    """
+    now = now if now is not None else time.time()
+    cache_control = _parse_cache_control(headers.get('Cache-Control', ''))
+    if 'no-store' in cache_control or 'private' in cache_control:
+        return None
+    if headers.get('Vary', '').strip() == '*':
+        return None
+    if 'no-cache' in cache_control:
+        return 0.0
+
+    for directive in ('s-maxage', 'max-age'):
+        if cache_control.get(directive):
+            try:
+                age = float(headers.get('Age', 0) or 0)
+                return max(0.0, float(cache_control[directive]) - age)
+            except ValueError:
+                pass
+
+    if 'Expires' in headers:
+        expires = _parse_http_date(headers.get('Expires'))
+        if expires is None:  # Invalid Expires means "already expired"
+            return 0.0
+        date = _parse_http_date(headers.get('Date')) or now
+        return max(0.0, expires - date)
+
+    last_modified = _parse_http_date(headers.get('Last-Modified'))
+    if last_modified is not None:
+        date = _parse_http_date(headers.get('Date')) or now
+        return max(0.0, min((date - last_modified) * 0.1, DEFAULT_HEURISTIC_TTL))
+    return float(DEFAULT_HEURISTIC_TTL)
+
+
+class PageCache:
+    """Byte-bounded in-memory LRU of fetched pages, optionally backed by a directory shared across workers."""
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, disk_dir: str | None = None,
+                 disk_max_bytes: int = 512 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self._entries: "OrderedDict[str, CachedPage]" = OrderedDict()
+        self._current_bytes = 0
+        self._disk_bytes: int | None = None  # Unknown until the first scan
+        self._disk_writes_since_scan = 0
+        self._lock = threading.Lock()
+        self._stats = {
+            'hits': 0, 'misses': 0, 'revalidated': 0, 'stores': 0, 'evictions': 0,
+            'disk_hits': 0, 'bytes_saved': 0,
+        }
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    @classmethod
+    def from_env(cls) -> "PageCache":
+        return cls(
+            max_bytes=int(os.getenv("PAGE_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+            disk_dir=os.getenv("PAGE_CACHE_DIR") or None,
+            disk_max_bytes=int(os.getenv("PAGE_CACHE_DISK_MAX_BYTES", str(512 * 1024 * 1024))),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0 or bool(self.disk_dir)
+
+    @staticmethod
+    def _key(url: str) -> str:
+        return hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+    def _count(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self._stats[name] += amount
+
+    def lookup(self, url: str) -> CachedPage | None:
+        """Return the cached entry for url (fresh or stale), checking memory first and then disk."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is not None:
+                self._entries.move_to_end(url)
+        if entry is None and self.disk_dir:
+            entry = self._read_disk(url)
+            if entry is not None:
+                self._count('disk_hits')
+                self._insert_memory(entry)
+        return entry
+
+    def record_hit(self, entry: CachedPage) -> None:
+        with self._lock:
+            self._stats['hits'] += 1
+            self._stats['bytes_saved'] += entry.size
+
+    def record_miss(self) -> None:
+        self._count('misses')
+
+    def store(self, url: str, text: str, content_type: str, headers: Mapping[str, str]) -> CachedPage | None:
+        """Store a 200 response if its headers allow it. Returns the new entry, or None if not storable."""
+        if not self.enabled:
+            return None
+        lifetime = freshness_lifetime(headers)
+        if lifetime is None:
+            self.invalidate(url)
+            return None
+        entry = CachedPage(
+            url, text, content_type,
+            etag=headers.get('ETag'),
+            last_modified=headers.get('Last-Modified'),
+            expires_at=time.time() + lifetime,
+        )
+        if lifetime <= 0 and not entry.can_revalidate():
+            return None  # Would never be served without a full refetch
+        self._insert_memory(entry)
+        self._write_disk(entry)
+        self._count('stores')
+        return entry
+
+    def refresh(self, entry: CachedPage, headers: Mapping[str, str]) -> CachedPage:
+        """Update a stale entry after the origin answered 304 Not Modified."""
+        lifetime = freshness_lifetime(headers)
+        entry.expires_at = time.time() + (lifetime or 0.0)
+        entry.etag = headers.get('ETag') or entry.etag
+        entry.last_modified = headers.get('Last-Modified') or entry.last_modified
+        with self._lock:
+            self._stats['revalidated'] += 1
+            self._stats['bytes_saved'] += entry.size
+        self._insert_memory(entry)
+        self._write_disk(entry)
+        return entry
+
+    def invalidate(self, url: str) -> None:
+        with self._lock:
+            entry = self._entries.pop(url, None)
+            if entry is not None:
+                self._current_bytes -= entry.size
+        if self.disk_dir:
+            try:
+                os.remove(os.path.join(self.disk_dir, self._key(url)))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"Could not remove cached page for {url}: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+            stats['bytes'] = self._current_bytes
+        lookups = stats['hits'] + stats['misses'] + stats['revalidated']
+        stats['hit_ratio'] = round((stats['hits'] + stats['revalidated']) / lookups, 4) if lookups else 0.0
+        return stats
+
+    def _insert_memory(self, entry: CachedPage) -> None:
+        if entry.size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(entry.url, None)
+            if previous is not None:
+                self._current_bytes -= previous.size
+            self._entries[entry.url] = entry
+            self._current_bytes += entry.size
+            while self._current_bytes > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._current_bytes -= evicted.size
+                self._stats['evictions'] += 1
+
+    def _read_disk(self, url: str) -> CachedPage | None:
+        path = os.path.join(self.disk_dir, self._key(url))
+        try:
+            with open(path, 'rb') as f:
+                meta = json.loads(f.readline())
+                text = f.read().decode('utf-8')
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Discarding unreadable cached page for {url}: {e}")
+            return None
+        if meta.get('url') != url:
+            return None
+        return CachedPage(
+            url, text, meta.get('content_type', ''), etag=meta.get('etag'),
+            last_modified=meta.get('last_modified'), expires_at=meta.get('expires_at', 0.0),
+            stored_at=meta.get('stored_at'),
+        )
+
+    def _write_disk(self, entry: CachedPage) -> None:
+        if not self.disk_dir:
+            return
+        tmp_path = None
+        try:
+            # Write to a temp file and rename so other workers never read a partial entry.
+            fd, tmp_path = tempfile.mkstemp(dir=self.disk_dir, prefix='.tmp-')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(json.dumps(entry.to_meta()).encode('utf-8') + b'\n')
+                f.write(entry.text.encode('utf-8'))
+                written = f.tell()
+            path = os.path.join(self.disk_dir, self._key(entry.url))
+            try:
+                replaced = os.path.getsize(path)
+            except FileNotFoundError:
+                replaced = 0
+            os.replace(tmp_path, path)
+            tmp_path = None
+            if self._track_disk_write(written - replaced):
+                self._prune_disk()
+        except OSError as e:
+            logger.warning(f"Could not write cached page for {entry.url} to disk: {e}")
+            if tmp_path is not None:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+
+    def _track_disk_write(self, delta: int) -> bool:
+        """Account for one disk write; True when the directory should be scanned and pruned."""
+        with self._lock:
+            self._disk_writes_since_scan += 1
+            if self._disk_bytes is None or self._disk_writes_since_scan >= DISK_RESCAN_WRITES:
+                return True
+            self._disk_bytes += delta
+            return self._disk_bytes > self.disk_max_bytes
+
+    def _prune_disk(self) -> None:
+        files = []
+        total = 0
+        for dir_entry in os.scandir(self.disk_dir):
+            if dir_entry.is_file() and not dir_entry.name.startswith('.tmp-'):
+                stat = dir_entry.stat()
+                files.append((stat.st_mtime, stat.st_size, dir_entry.path))
+                total += stat.st_size
+        if total > self.disk_max_bytes:
+            # Prune below the cap so that the next few writes do not each trigger a scan again
+            target = self.disk_max_bytes * DISK_PRUNE_TARGET
+            for _, size, path in sorted(files):
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                if total <= target:
+                    break
+        with self._lock:
+            self._disk_bytes = total
+            self._disk_writes_since_scan = 0
+
+page_cache = PageCache.from_env()
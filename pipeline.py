@@ -0,0 +1,104 @@
+import logging
+import os
+import threading
+import time
+from typing import Dict, Any
+
+from bs4 import BeautifulSoup
+
+logger = logging.getLogger(__name__)
+
+# 'auto' picks the fastest installed backend; set HTML_PARSER to force one.
+HTML_PARSER = os.getenv("HTML_PARSER", "auto").lower()
+
+_PARSER_PREFERENCE = ['lxml', 'html5-parser', 'html.parser']
+
+
+def _backend_available(name: str) -> bool:
+    if name not in _PARSER_PREFERENCE:
+        return False  # Unknown names (typos, uninstalled bs4 builders) would fail in every make_soup
+    try:
+        if name == 'lxml':
+            import lxml  # noqa: F401
+        elif name == 'html5-parser':
+            import html5_parser  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def _select_backend() -> str:
+    if HTML_PARSER != 'auto':
+        if _backend_available(HTML_PARSER):
+            return HTML_PARSER
+        logger.warning(f"HTML_PARSER={HTML_PARSER} is not installed or not supported; falling back to auto-detection")
+    for name in _PARSER_PREFERENCE:
+        if _backend_available(name):
+            return name
+    return 'html.parser'
+
+
+PARSER_BACKEND = _select_backend()
+logger.info(f"Using HTML parser backend: {PARSER_BACKEND}")
+
+
+def make_soup(markup: str | bytes) -> BeautifulSoup:
+    """Build a BeautifulSoup tree with the configured parser backend."""
+    if PARSER_BACKEND == 'html5-parser':
+        from html5_parser import parse
+        return parse(markup, treebuilder='soup', return_root=False)
+    return BeautifulSoup(markup, PARSER_BACKEND)
+
+
+class Document:
+    """A fetched page carried through the scrape -> parse stages.
+
+    The tree is built lazily on first access to ``soup`` and then reused, so the
+    document is parsed at most once per request.
+    """
+
+    def __init__(self, url: str, html: str, content_type: str = 'text/html', from_cache: bool = False):
+        self.url = url
+        self.html = html
+        self.content_type = content_type
+        self.from_cache = from_cache
+        self.parse_seconds = 0.0
+        self.bytes_fetched = 0
+        self.bytes_used = 0
+        self.truncated = False
+        self.stopped_early = False
+        self._soup: BeautifulSoup | None = None
+        self._soup_lock = threading.Lock()
+
+    def record_fetch(self, result) -> None:
+        """Copy download accounting from a streaming.StreamResult."""
+        self.bytes_fetched = result.bytes_fetched
+        self.truncated = result.truncated
+        self.stopped_early = result.stopped_early
+
+    def fetch_stats(self) -> Dict[str, Any]:
+        return {
+            'bytes_fetched': self.bytes_fetched,
+            'bytes_used': self.bytes_used,
+            'truncated': self.truncated,
+            'stopped_early': self.stopped_early,
+            'from_cache': self.from_cache,
+        }
+
+    @property
+    def soup(self) -> BeautifulSoup:
+        if self._soup is None:
+            with self._soup_lock: # Coalesced requests may share one Document across threads
+                if self._soup is None:
+                    started = time.perf_counter()
+                    self._soup = make_soup(self.html)
+                    self.parse_seconds = time.perf_counter() - started
+                    logger.info(f"Parsed {len(self.html)} chars from {self.url} with {PARSER_BACKEND} in {self.parse_seconds:.3f}s")
+        return self._soup
+
+    @property
+    def is_parsed(self) -> bool:
+        return self._soup is not None
+
+    def __len__(self) -> int:
+        return len(self.html)
@@ -0,0 +1,140 @@
+import hashlib
+import logging
+import math
+import os
+import re
+import threading
+from collections import Counter, OrderedDict
+from typing import Callable, Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+RETRIEVAL_CHUNK_CHARS = int(os.getenv("RETRIEVAL_CHUNK_CHARS", "800"))
+# Default character budget for the selected chunks; pages that already fit are passed through whole.
+RETRIEVAL_BUDGET_CHARS = int(os.getenv("RETRIEVAL_BUDGET_CHARS", "12000"))
+RETRIEVAL_INDEX_CACHE_SIZE = int(os.getenv("RETRIEVAL_INDEX_CACHE_SIZE", "64"))
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+STOPWORDS = frozenset("""
+a an and are as at be but by can do does for from has have how i if in into is it its of on or so that the
+their them there these they this to was were what when where which who why will with you your about
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in _TOKEN_RE.findall(text.lower()) if token not in STOPWORDS]
+
+
+def split_into_chunks(paragraphs: List[str], chunk_chars: int = RETRIEVAL_CHUNK_CHARS) -> List[str]:
+    """Split paragraphs into chunks of at most roughly chunk_chars, breaking on sentence boundaries."""
+    chunks = []
+    for paragraph in paragraphs:
+        if len(paragraph) <= chunk_chars:
+            chunks.append(paragraph)
+            continue
+        current = ''
+        for sentence in _SENTENCE_RE.split(paragraph):
+            while len(sentence) > chunk_chars:  # A single run-on "sentence"; hard split it
+                if current:
+                    chunks.append(current)
+                    current = ''
+                chunks.append(sentence[:chunk_chars])
+                sentence = sentence[chunk_chars:]
+            if current and len(current) + 1 + len(sentence) > chunk_chars:
+                chunks.append(current)
+                current = sentence
+            else:
+                current = f"{current} {sentence}" if current else sentence
+        if current:
+            chunks.append(current)
+    return chunks
+
+
+class ChunkIndex:
+    """In-process BM25 inverted index over the chunks of one page."""
+
+    def __init__(self, chunks: List[str]):
+        self.chunks = chunks
+        self.postings: Dict[str, List[Tuple[int, int]]] = {}
+        self.lengths: List[int] = []
+        for chunk_id, chunk in enumerate(chunks):
+            counts = Counter(tokenize(chunk))
+            self.lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                self.postings.setdefault(term, []).append((chunk_id, tf))
+        self.average_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+
+    def score(self, query: str) -> Dict[int, float]:
+        scores: Dict[int, float] = {}
+        n = len(self.chunks)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for chunk_id, tf in postings:
+                norm = 1 - BM25_B + BM25_B * self.lengths[chunk_id] / (self.average_length or 1)
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * norm)
+        return scores
+
+    def select(self, query: str, budget: int, measure: Callable[[str], int] = len) -> List[str]:
+        """Best-scoring chunks whose total measure (chars by default) fits in budget, in page order.
+
+        Leftover budget is filled with non-matching chunks from the top of the page, which
+        is also all that is sent when nothing in the question matches.
+        """
+        scores = self.score(query)
+        ranked = sorted(scores, key=lambda chunk_id: (-scores[chunk_id], chunk_id))
+        ranked += [chunk_id for chunk_id in range(len(self.chunks)) if chunk_id not in scores]
+        chosen = []
+        used = 0
+        for chunk_id in ranked:
+            length = measure(self.chunks[chunk_id])
+            if used + length > budget:
+                continue  # A smaller chunk further down may still fit
+            chosen.append(chunk_id)
+            used += length
+        return [self.chunks[chunk_id] for chunk_id in sorted(chosen)]
+
+
+def content_hash(paragraphs: List[str]) -> str:
+    digest = hashlib.sha256()
+    for paragraph in paragraphs:
+        digest.update(paragraph.encode('utf-8'))
+        digest.update(b'\x00')
+    return digest.hexdigest()
+
+
+_index_cache: "OrderedDict[str, ChunkIndex]" = OrderedDict()
+_index_lock = threading.Lock()
+
+
+def get_index(paragraphs: List[str]) -> ChunkIndex:
+    """Return the chunk index for these paragraphs, reusing it for follow-up questions on the same page."""
+    key = content_hash(paragraphs)
+    with _index_lock:
+        index = _index_cache.get(key)
+        if index is not None:
+            _index_cache.move_to_end(key)
+            return index
+    index = ChunkIndex(split_into_chunks(paragraphs))
+    with _index_lock:
+        _index_cache[key] = index
+        while len(_index_cache) > RETRIEVAL_INDEX_CACHE_SIZE:
+            _index_cache.popitem(last=False)
+    return index
+
+
+def select_relevant(paragraphs: List[str], question: str, budget: int = RETRIEVAL_BUDGET_CHARS,
+                    measure: Callable[[str], int] = len) -> List[str]:
+    """Return the parts of paragraphs most relevant to question within budget (in units of measure)."""
+    if sum(measure(paragraph) for paragraph in paragraphs) <= budget:
+        return paragraphs
+    index = get_index(paragraphs)
+    selected = index.select(question, budget, measure)
+    logger.info(f"Selected {len(selected)} of {len(index.chunks)} chunks ({sum(map(measure, selected))}/{budget}) for the question")
+    return selected
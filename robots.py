@@ -0,0 +1,192 @@
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+from urllib.parse import urlparse
+
+import requests
+
+from http_pool import get_session, origin_of
+
+logger = logging.getLogger(__name__)
+
+ROBOTS_CACHE_TTL = int(os.getenv("ROBOTS_CACHE_TTL", "3600"))
+# Failed fetches (timeouts, 5xx) are remembered for a shorter time so one bad origin doesn't cost a round trip per request.
+ROBOTS_NEGATIVE_TTL = int(os.getenv("ROBOTS_NEGATIVE_TTL", "300"))
+ROBOTS_CACHE_MAX_ENTRIES = int(os.getenv("ROBOTS_CACHE_MAX_ENTRIES", "1024"))
+ROBOTS_TIMEOUT = float(os.getenv("ROBOTS_TIMEOUT", "5"))
+ROBOTS_MAX_BYTES = 500 * 1024  # RFC 9309 lets crawlers ignore anything past 500 KiB
+
+
+def _compile_pattern(path: str) -> re.Pattern:
+    """Translate a robots.txt path pattern ('*' wildcard, trailing '$' anchor) to a regex."""
+    anchored = path.endswith('$')
+    if anchored:
+        path = path[:-1]
+    regex = '.*'.join(re.escape(part) for part in path.split('*'))
+    return re.compile(regex + ('$' if anchored else ''))
+
+
+class RobotsGroup:
+    """Rules of one user-agent group."""
+
+    def __init__(self, agents: List[str]):
+        self.agents = agents
+        self.rules: List[Tuple[bool, str, re.Pattern]] = []  # (allow, raw path, compiled)
+        self.crawl_delay: float | None = None
+
+    def add_rule(self, allow: bool, path: str) -> None:
+        self.rules.append((allow, path, _compile_pattern(path)))
+
+    def allows(self, path: str) -> bool:
+        # Longest matching rule wins; on a tie Allow beats Disallow (RFC 9309 section 2.2.2).
+        best_len = -1
+        best_allow = True
+        for allow, raw, pattern in self.rules:
+            if pattern.match(path):
+                length = len(raw)
+                if length > best_len or (length == best_len and allow):
+                    best_len = length
+                    best_allow = allow
+        return best_allow
+
+
+class RobotsRules:
+    """Parsed robots.txt for one origin."""
+
+    def __init__(self, groups: List[RobotsGroup] | None = None, sitemaps: List[str] | None = None):
+        self.groups = groups or []
+        self.sitemaps = sitemaps or []
+
+    @classmethod
+    def parse(cls, text: str) -> "RobotsRules":
+        groups: List[RobotsGroup] = []
+        sitemaps: List[str] = []
+        current: RobotsGroup | None = None
+        in_agent_lines = False
+        for raw_line in text.splitlines():
+            line = raw_line.split('#', 1)[0].strip()
+            if ':' not in line:
+                continue
+            field, _, value = line.partition(':')
+            field = field.strip().lower()
+            value = value.strip()
+            if field == 'user-agent':
+                # Consecutive user-agent lines share one group.
+                if not in_agent_lines:
+                    current = RobotsGroup([])
+                    groups.append(current)
+                current.agents.append(value.lower())
+                in_agent_lines = True
+                continue
+            in_agent_lines = False
+            if field == 'sitemap':
+                if value:
+                    sitemaps.append(value)
+            elif current is None:
+                continue
+            elif field in ('allow', 'disallow'):
+                if value:  # An empty Disallow means "allow everything"
+                    current.add_rule(field == 'allow', value)
+            elif field == 'crawl-delay':
+                try:
+                    current.crawl_delay = float(value)
+                except ValueError:
+                    pass
+        return cls(groups, sitemaps)
+
+    def group_for(self, user_agent: str) -> RobotsGroup | None:
+        """Pick the group whose user-agent token best matches, falling back to '*'."""
+        product = user_agent.lower()
+        best: RobotsGroup | None = None
+        best_len = 0
+        fallback: RobotsGroup | None = None
+        for group in self.groups:
+            for agent in group.agents:
+                if agent == '*':
+                    fallback = fallback or group
+                elif agent in product and len(agent) > best_len:
+                    best, best_len = group, len(agent)
+        return best or fallback
+
+    def can_fetch(self, user_agent: str, url: str) -> bool:
+        group = self.group_for(user_agent)
+        if group is None:
+            return True
+        parsed = urlparse(url)
+        path = parsed.path or '/'
+        if parsed.query:
+            path += '?' + parsed.query
+        return group.allows(path)
+
+    def crawl_delay(self, user_agent: str) -> float | None:
+        group = self.group_for(user_agent)
+        return group.crawl_delay if group else None
+
+
+ALLOW_ALL = RobotsRules()
+
+
+class RobotsCache:
+    """Per-origin cache of parsed robots.txt with TTL and negative caching of failed fetches."""
+
+    def __init__(self, ttl: int = ROBOTS_CACHE_TTL, negative_ttl: int = ROBOTS_NEGATIVE_TTL,
+                 max_entries: int = ROBOTS_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[RobotsRules, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'negative': 0}
+
+    def rules_for(self, url: str, headers: Dict[str, str]) -> RobotsRules:
+        origin = origin_of(url)
+        now = time.time()
+        with self._lock:
+            cached = self._entries.get(origin)
+            if cached is not None and cached[1] > now:
+                self._entries.move_to_end(origin)
+                self._stats['hits'] += 1
+                return cached[0]
+            self._stats['misses'] += 1
+
+        rules, ttl = self._fetch(origin, headers)
+        with self._lock:
+            self._entries[origin] = (rules, time.time() + ttl)
+            self._entries.move_to_end(origin)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return rules
+
+    def _fetch(self, origin: str, headers: Dict[str, str]) -> Tuple[RobotsRules, float]:
+        robots_url = origin + "/robots.txt"
+        try:
+            response = get_session(robots_url).get(robots_url, headers=headers, timeout=ROBOTS_TIMEOUT,
+                                                   allow_redirects=True)
+        except requests.exceptions.RequestException as e:
+            logger.info(f"Could not fetch robots.txt at {robots_url}: {e}")
+            self._count_negative()
+            return ALLOW_ALL, self.negative_ttl
+
+        if response.status_code == 200:
+            return RobotsRules.parse(response.content[:ROBOTS_MAX_BYTES].decode('utf-8', errors='replace')), self.ttl
+        if 400 <= response.status_code < 500:
+            # A missing robots.txt means no restrictions; it is a real answer, so cache it for the full TTL.
+            return ALLOW_ALL, self.ttl
+        logger.info(f"robots.txt at {robots_url} returned {response.status_code}; treating as unrestricted for now")
+        self._count_negative()
+        return ALLOW_ALL, self.negative_ttl
+
+    def _count_negative(self) -> None:
+        with self._lock:
+            self._stats['negative'] += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats, entries=len(self._entries))
+
+
+robots_cache = RobotsCache()
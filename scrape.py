@@ -1,60 +1,137 @@
 import requests
-from urllib.parse import urlparse, urljoin
+from urllib.parse import urlparse
 import logging
-from bs4 import BeautifulSoup # For basic sitemap check
+import time
+from page_cache import page_cache, CachedPage
+from pipeline import Document
+from streaming import BudgetMonitor, read_streamed, SCRAPE_EARLY_STOP, SCRAPE_MAX_BYTES
+from http_pool import get_session, origin_of
+from robots import robots_cache
+from metrics import fetch_bytes, stage
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def scrape_website(url: str, timeout: int = 15) -> str | None:
-    """Scrape a website and return its HTML content."""
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36 Edg/91.0.864.48 ZScraper/1.0'
+DEFAULT_HEADERS = {
+    'User-Agent': USER_AGENT,
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.9',
+    'Connection': 'keep-alive',
+    'DNT': '1', # Do Not Track
+}
+
+def _wrap_content(url: str, text: str, content_type: str) -> str | None:
+    """Return page text as HTML, wrapping JSON and plain text so the parser can handle them."""
+    if 'text/html' in content_type:
+        return text
+    logger.warning(f"URL {url} does not return HTML content. Content-Type: {content_type}")
+    # For non-HTML, maybe return a summary or handle differently later
+    if 'application/json' in content_type:
+        return f"<html><body><pre>{text}</pre></body></html>" # Wrap JSON in pre for parsing
+    elif 'text/plain' in content_type:
+        return f"<html><body><pre>{text}</pre></body></html>" # Wrap plain text
+    return None # Or handle as error
+
+def _looks_client_rendered(document: Document) -> bool:
+    """Heuristic: almost no server-rendered body text but references to a JS framework."""
+    body = document.soup.body
+    body_text_length = 0
+    if body:
+        for text in body.stripped_strings:
+            body_text_length += len(text)
+            if body_text_length >= 100:
+                return False
+    html_lower = document.html.lower()
+    return any(marker in html_lower for marker in ("javascript", "react", "vue", "angular"))
+
+def fetch_document(url: str, timeout: int = 15, max_content_length: int = 50000, max_paragraphs: int | None = 10,
+                   max_bytes: int = SCRAPE_MAX_BYTES, early_stop: bool = SCRAPE_EARLY_STOP) -> Document | None:
+    """Scrape a website and return it as a Document whose tree is built at most once.
+
+    The body is streamed: downloads stop at max_bytes, or (with early_stop) once enough
+    text has arrived to fill a parse_content budget of max_content_length. Early stop
+    trades completeness (later headings) and page caching for fewer bytes; see SCRAPE_EARLY_STOP.
+    """
     try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36 Edg/91.0.864.48 ZScraper/1.0',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8',
-            'Accept-Language': 'en-US,en;q=0.9',
-            'Connection': 'keep-alive',
-            'DNT': '1', # Do Not Track
-        }
+        headers = DEFAULT_HEADERS
         
         parsed_url = urlparse(url)
         if not parsed_url.scheme:
             url = 'https://' + url # Default to https
         
+        with stage('page_cache'):
+            cached = page_cache.lookup(url)
+        if cached is not None and cached.is_fresh():
+            page_cache.record_hit(cached)
+            logger.info(f"Serving {url} from page cache (stored {int(time.time() - cached.stored_at)}s ago)")
+            return _cached_document(url, cached)
+
         logger.info(f"Attempting to fetch URL: {url}")
         
-        # Basic robots.txt check (very simplified, not fully compliant)
+        # robots.txt is parsed once per origin and cached; failed fetches are cached briefly too
         try:
-            robots_url = urljoin(url, "/robots.txt")
-            robots_resp = requests.get(robots_url, headers=headers, timeout=5, allow_redirects=True)
-            if robots_resp.status_code == 200:
-                if "Disallow: /" in robots_resp.text and "User-agent: *" in robots_resp.text: # Very naive check
-                    logger.warning(f"robots.txt at {robots_url} disallows all scraping. Proceeding with caution.")
-                # A real implementation would parse robots.txt properly
+            with stage('robots'):
+                allowed = robots_cache.rules_for(url, headers).can_fetch(USER_AGENT, url)
+            if not allowed:
+                logger.warning(f"robots.txt for {origin_of(url)} disallows {url}. Proceeding with caution.")
         except Exception as e_robots:
             logger.info(f"Could not fetch or parse robots.txt for {url}: {e_robots}")
 
-        response = requests.get(url, headers=headers, timeout=timeout, allow_redirects=True)
+        request_headers = dict(headers)
+        if cached is not None and cached.can_revalidate():
+            request_headers.update(cached.conditional_headers()) # Conditional GET; a 304 has no body
+
+        with stage('fetch_headers'):
+            response = get_session(url).get(url, headers=request_headers, timeout=timeout, allow_redirects=True, stream=True)
+        if response.status_code == 304 and cached is not None:
+            response.close()
+            cached = page_cache.refresh(cached, response.headers)
+            logger.info(f"{url} not modified since last fetch; revalidated cached copy")
+            return _cached_document(url, cached)
+        if not response.ok:
+            response.close()
         response.raise_for_status() # Raises an HTTPError if the HTTP request returned an unsuccessful status code
+        page_cache.record_miss()
         
         content_type = response.headers.get('content-type', '').lower()
-        if 'text/html' not in content_type:
+        is_html = 'text/html' in content_type
+        if not is_html and 'application/json' not in content_type and 'text/plain' not in content_type:
+            response.close()
             logger.warning(f"URL {url} does not return HTML content. Content-Type: {content_type}")
-            # For non-HTML, maybe return a summary or handle differently later
-            if 'application/json' in content_type:
-                return f"<html><body><pre>{response.text}</pre></body></html>" # Wrap JSON in pre for parsing
-            elif 'text/plain' in content_type:
-                 return f"<html><body><pre>{response.text}</pre></body></html>" # Wrap plain text
             return None # Or handle as error
+        monitor = BudgetMonitor(max_content_length, max_paragraphs) if is_html and early_stop else None
+        with stage('fetch_body'):
+            body = read_streamed(response, content_type, max_bytes=max_bytes, monitor=monitor)
+        fetch_bytes.observe(body.bytes_fetched)
+        if body.truncated:
+            logger.warning(f"Stopped downloading {url} at the {max_bytes} byte cap")
+        elif body.stopped_early:
+            logger.info(f"Stopped downloading {url} after {body.bytes_fetched} bytes; content budget already filled")
+
+        complete = not (body.truncated or body.stopped_early) # Partial bodies are never cached
+        if not is_html:
+            if complete:
+                page_cache.store(url, body.text, content_type, response.headers)
+            document = Document(url, _wrap_content(url, body.text, content_type), content_type)
+            document.record_fetch(body)
+            return document
         
-        # Basic check for client-side rendering indication (very heuristic)
-        soup_check = BeautifulSoup(response.content, 'html.parser')
-        body_text_sample = soup_check.body.get_text(strip=True, limit=500) if soup_check.body else ""
-        if len(body_text_sample) < 100 and ("javascript" in response.text.lower() or "react" in response.text.lower() or "vue" in response.text.lower() or "angular" in response.text.lower()):
+        document = Document(url, body.text, content_type)
+        document.record_fetch(body)
+        # Basic check for client-side rendering indication (very heuristic). The tree built
+        # here is kept on the document and reused by parse_content.
+        with stage('tree_build'):
+            document.soup  # Built once here; parse_content reuses the same tree
+        with stage('csr_sniff'):
+            client_rendered = _looks_client_rendered(document)
+        if client_rendered:
             logger.warning(f"URL {url} might heavily rely on client-side JavaScript for rendering. Scraped content might be incomplete.")
 
-        logger.info(f"Successfully fetched HTML from {url}. Content length: {len(response.text)}")
-        return response.text
+        logger.info(f"Successfully fetched HTML from {url}. Content length: {len(body.text)}")
+        if complete:
+            page_cache.store(url, body.text, content_type, response.headers)
+        return document
     
     except requests.exceptions.HTTPError as http_err:
         logger.error(f"HTTP error for {url}: {http_err}")
@@ -72,3 +149,11 @@ def scrape_website(url: str, timeout: int = 15) -> str | None:
         logger.error(f"Unexpected error while scraping {url}: {type(e).__name__} - {str(e)}")
         return None
 
+def _cached_document(url: str, cached: CachedPage) -> Document | None:
+    html = _wrap_content(url, cached.text, cached.content_type)
+    return Document(url, html, cached.content_type, from_cache=True) if html is not None else None
+
+def scrape_website(url: str, timeout: int = 15) -> str | None:
+    """Scrape a website and return its HTML content."""
+    document = fetch_document(url, timeout=timeout)
+    return document.html if document is not None else None
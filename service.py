@@ -0,0 +1,35 @@
+import logging
+from typing import Dict, Any, Tuple
+
+from api import context_char_budget
+from parse import parse_content
+from pipeline import Document
+from scrape import fetch_document
+from singleflight import SingleFlight
+from metrics import content_bytes, stage
+
+logger = logging.getLogger(__name__)
+
+scrape_flight = SingleFlight('scrape')
+
+
+def scrape_and_parse(url: str, model_key: str) -> Tuple[Document | None, Dict[str, Any] | None]:
+    """Fetch and parse url with an extraction budget sized for model_key.
+
+    Concurrent calls for the same URL and budget share one fetch and parse. The returned
+    document and dict are shared between those callers and must not be modified.
+    """
+    char_budget = context_char_budget(model_key.lower())
+
+    def run() -> Tuple[Document | None, Dict[str, Any] | None]:
+        document = fetch_document(url, max_content_length=char_budget, max_paragraphs=None)
+        if document is None:
+            return None, None
+        with stage('parse_content'):
+            parsed_data = parse_content(document, max_content_length=char_budget, max_titles=None, max_paragraphs=None)
+        if not document.from_cache:
+            content_bytes.observe(document.bytes_used)
+        logger.info(f"Parsed {url}. Fetch stats: {document.fetch_stats()}")
+        return document, parsed_data
+
+    return scrape_flight.do(f"{url}\x00{char_budget}", run)
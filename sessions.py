@@ -0,0 +1,303 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+from typing import Dict, Any, List, Tuple
+
+from api import (MODEL_CONFIG, PROMPT_INSTRUCTIONS, SYSTEM_PROMPT, chat_completion, context_token_budget,
+                 format_context)
+from service import scrape_and_parse
+from tokens import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+SESSION_IDLE_TTL = int(os.getenv("SESSION_IDLE_TTL", "1800"))
+SESSION_MAX = int(os.getenv("SESSION_MAX", "1000"))
+# Prompt tokens kept free for earlier turns when a session's webpage context is sized.
+SESSION_HISTORY_TOKENS = int(os.getenv("SESSION_HISTORY_TOKENS", "4000"))
+# Mark the system-plus-context prefix with cache_control for providers that need an explicit breakpoint.
+SESSION_PROMPT_CACHE = os.getenv("SESSION_PROMPT_CACHE", "true").lower() == "true"
+# 'memory' only works with a single gunicorn worker; 'sqlite' shares sessions between workers.
+SESSION_STORE_BACKEND = os.getenv("SESSION_STORE_BACKEND", "memory").lower()
+SESSION_STORE_PATH = os.getenv("SESSION_STORE_PATH", "sessions.sqlite3")
+# Rough per-message overhead of the chat format, in tokens.
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def snapshot_digest(context: str) -> str:
+    return hashlib.sha256(context.encode('utf-8')).hexdigest()
+
+
+class MemorySessionStore:
+    """Sessions in an LRU bounded by max_sessions; snapshots stored once per content hash."""
+
+    def __init__(self, max_sessions: int = SESSION_MAX):
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._snapshots: Dict[str, bytes] = {}
+        self._lock = threading.Lock()
+
+    def get_snapshot(self, digest: str) -> bytes | None:
+        with self._lock:
+            return self._snapshots.get(digest)
+
+    def create_with_snapshot(self, session: Dict[str, Any], data: bytes) -> None:
+        """Add session and its snapshot together, so orphan cleanup can never run in between."""
+        with self._lock:
+            self._snapshots.setdefault(session['snapshot'], data)
+            self._sessions[session['id']] = dict(session, turns=[])
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+            self._drop_orphaned_snapshots()
+
+    def get(self, session_id: str) -> Dict[str, Any] | None:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            return dict(session, turns=list(session['turns'])) if session else None
+
+    def touch(self, session_id: str, now: float) -> None:
+        with self._lock:
+            if session_id in self._sessions:
+                self._sessions[session_id]['last_used'] = now
+                self._sessions.move_to_end(session_id)
+
+    def append_turn(self, session_id: str, question: str, answer: str, now: float) -> int:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return 0
+            session['turns'].append({'question': question, 'answer': answer, 'at': now})
+            session['last_used'] = now
+            return len(session['turns'])
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            deleted = self._sessions.pop(session_id, None) is not None
+            self._drop_orphaned_snapshots()
+            return deleted
+
+    def purge_idle(self, cutoff: float) -> int:
+        with self._lock:
+            idle = [session_id for session_id, session in self._sessions.items() if session['last_used'] <= cutoff]
+            for session_id in idle:
+                del self._sessions[session_id]
+            self._drop_orphaned_snapshots()
+        return len(idle)
+
+    def _drop_orphaned_snapshots(self) -> None:
+        in_use = {session['snapshot'] for session in self._sessions.values()}
+        for digest in [digest for digest in self._snapshots if digest not in in_use]:
+            del self._snapshots[digest]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'sessions': len(self._sessions), 'snapshots': len(self._snapshots),
+                    'snapshot_bytes': sum(len(data) for data in self._snapshots.values())}
+
+
+class SQLiteSessionStore:
+    """Sessions, turns and snapshots in a SQLite file shared by all worker processes."""
+
+    _COLUMNS = ('id', 'url', 'model', 'snapshot', 'context_tokens', 'created_at', 'last_used')
+
+    def __init__(self, path: str, max_sessions: int = SESSION_MAX):
+        self.path = path
+        self.max_sessions = max_sessions
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS snapshots (digest TEXT PRIMARY KEY, data BLOB)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, url TEXT, model TEXT, snapshot TEXT, "
+                "context_tokens INTEGER, created_at REAL, last_used REAL)"
+            )
+            conn.execute("CREATE TABLE IF NOT EXISTS turns (session_id TEXT, position INTEGER PRIMARY KEY AUTOINCREMENT, "
+                         "question TEXT, answer TEXT, at REAL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS turns_session ON turns (session_id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS sessions_last_used ON sessions (last_used)")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=5)
+
+    def get_snapshot(self, digest: str) -> bytes | None:
+        with self._connect() as conn:
+            row = conn.execute("SELECT data FROM snapshots WHERE digest = ?", (digest,)).fetchone()
+        return row[0] if row else None
+
+    def create_with_snapshot(self, session: Dict[str, Any], data: bytes) -> None:
+        """Add session and its snapshot in one transaction, so orphan cleanup can never run in between."""
+        with self._connect() as conn:
+            conn.execute("INSERT OR IGNORE INTO snapshots (digest, data) VALUES (?, ?)", (session['snapshot'], data))
+            conn.execute(f"INSERT INTO sessions ({', '.join(self._COLUMNS)}) VALUES ({', '.join('?' * len(self._COLUMNS))})",
+                         [session[column] for column in self._COLUMNS])
+            conn.execute("DELETE FROM sessions WHERE id IN (SELECT id FROM sessions ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                         (self.max_sessions,))
+            self._drop_orphans(conn)
+
+    def get(self, session_id: str) -> Dict[str, Any] | None:
+        with self._connect() as conn:
+            row = conn.execute(f"SELECT {', '.join(self._COLUMNS)} FROM sessions WHERE id = ?", (session_id,)).fetchone()
+            if row is None:
+                return None
+            turns = conn.execute("SELECT question, answer, at FROM turns WHERE session_id = ? ORDER BY position",
+                                 (session_id,)).fetchall()
+        session = dict(zip(self._COLUMNS, row))
+        session['turns'] = [{'question': question, 'answer': answer, 'at': at} for question, answer, at in turns]
+        return session
+
+    def touch(self, session_id: str, now: float) -> None:
+        with self._connect() as conn:
+            conn.execute("UPDATE sessions SET last_used = ? WHERE id = ?", (now, session_id))
+
+    def append_turn(self, session_id: str, question: str, answer: str, now: float) -> int:
+        with self._connect() as conn:
+            if conn.execute("UPDATE sessions SET last_used = ? WHERE id = ?", (now, session_id)).rowcount == 0:
+                return 0
+            conn.execute("INSERT INTO turns (session_id, question, answer, at) VALUES (?, ?, ?, ?)",
+                         (session_id, question, answer, now))
+            return conn.execute("SELECT COUNT(*) FROM turns WHERE session_id = ?", (session_id,)).fetchone()[0]
+
+    def delete(self, session_id: str) -> bool:
+        with self._connect() as conn:
+            deleted = conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,)).rowcount > 0
+            self._drop_orphans(conn)
+        return deleted
+
+    def purge_idle(self, cutoff: float) -> int:
+        with self._connect() as conn:
+            purged = conn.execute("DELETE FROM sessions WHERE last_used <= ?", (cutoff,)).rowcount
+            if purged:
+                self._drop_orphans(conn)
+        return purged
+
+    @staticmethod
+    def _drop_orphans(conn: sqlite3.Connection) -> None:
+        conn.execute("DELETE FROM turns WHERE session_id NOT IN (SELECT id FROM sessions)")
+        conn.execute("DELETE FROM snapshots WHERE digest NOT IN (SELECT snapshot FROM sessions)")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._connect() as conn:
+            sessions = conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+            snapshots, snapshot_bytes = conn.execute("SELECT COUNT(*), COALESCE(SUM(LENGTH(data)), 0) FROM snapshots").fetchone()
+        return {'sessions': sessions, 'snapshots': snapshots, 'snapshot_bytes': snapshot_bytes}
+
+
+class SessionManager:
+    """Multi-turn conversations about one pinned page snapshot.
+
+    Every turn is sent as the same system message (instructions plus the formatted page
+    context, fixed when the session is created) followed by the windowed earlier turns and
+    the new question, so providers can reuse the cached prefix from turn to turn.
+    """
+
+    def __init__(self, store, idle_ttl: int = SESSION_IDLE_TTL, history_tokens: int = SESSION_HISTORY_TOKENS):
+        self.store = store
+        self.idle_ttl = idle_ttl
+        self.history_tokens = history_tokens
+
+    @classmethod
+    def from_env(cls) -> "SessionManager":
+        if SESSION_STORE_BACKEND == 'sqlite':
+            return cls(SQLiteSessionStore(SESSION_STORE_PATH))
+        return cls(MemorySessionStore())
+
+    def create(self, url: str, model_key: str) -> Dict[str, Any] | None:
+        """Scrape and pin url for model_key. Returns None if the page could not be scraped."""
+        model_key = model_key.lower()
+        if model_key not in MODEL_CONFIG:
+            raise ValueError(f"Unknown model '{model_key}' selected.")
+        now = time.time()
+        self.store.purge_idle(now - self.idle_ttl)
+
+        document, parsed_data = scrape_and_parse(url, model_key)
+        if document is None:
+            return None
+        budget = max(0, context_token_budget(model_key) - self.history_tokens)
+        context = format_context(parsed_data, model_key=model_key, budget=budget)
+        digest = snapshot_digest(context)
+        session = {
+            'id': uuid.uuid4().hex, 'url': url, 'model': model_key, 'snapshot': digest,
+            'context_tokens': estimate_tokens(context), 'created_at': now, 'last_used': now,
+        }
+        self.store.create_with_snapshot(session, zlib.compress(context.encode('utf-8'), 6))
+        logger.info(f"Created session {session['id']} for {url} ({session['context_tokens']} context tokens, snapshot {digest[:12]})")
+        return dict(session, turns=[])
+
+    def get(self, session_id: str) -> Dict[str, Any] | None:
+        session = self.store.get(session_id)
+        if session is None or session['last_used'] <= time.time() - self.idle_ttl:
+            return None
+        return session
+
+    def delete(self, session_id: str) -> bool:
+        return self.store.delete(session_id)
+
+    def ask(self, session_id: str, question: str) -> Dict[str, Any] | None:
+        """Answer question as the next turn. None if the session is unknown or idle-expired.
+
+        Raises api.OpenRouterError if the model call fails; failed turns are not recorded.
+        """
+        session = self.get(session_id)
+        if session is None:
+            return None
+        data = self.store.get_snapshot(session['snapshot'])
+        if data is None:
+            return None
+        context = zlib.decompress(data).decode('utf-8')
+        self.store.touch(session_id, time.time())
+
+        model_key = session['model']
+        history_budget = context_token_budget(model_key, question) - estimate_tokens(context)
+        history, dropped = window_turns(session['turns'], history_budget)
+        messages = [prefix_message(context)]
+        for turn in history:
+            messages.append({"role": "user", "content": turn['question']})
+            messages.append({"role": "assistant", "content": turn['answer']})
+        messages.append({"role": "user", "content": question})
+        if dropped:
+            logger.info(f"Session {session_id}: dropped the {dropped} oldest of {len(session['turns'])} turns to fit the token budget")
+
+        answer = chat_completion(model_key, messages)
+        turn_number = self.store.append_turn(session_id, question, answer, time.time())
+        return {'answer': answer, 'turn': turn_number, 'history_turns_used': len(history), 'history_turns_dropped': dropped}
+
+    def stats(self) -> Dict[str, Any]:
+        return self.store.stats()
+
+
+def prefix_message(context: str) -> Dict[str, Any]:
+    """The system message shared by every turn of a session; byte-identical between turns."""
+    text = f"{SYSTEM_PROMPT}\n\n{PROMPT_INSTRUCTIONS}Webpage content:\n{context}"
+    if SESSION_PROMPT_CACHE:
+        return {"role": "system", "content": [{"type": "text", "text": text, "cache_control": {"type": "ephemeral"}}]}
+    return {"role": "system", "content": text}
+
+
+def window_turns(turns: List[Dict[str, Any]], budget: int) -> Tuple[List[Dict[str, Any]], int]:
+    """The most recent turns that fit in budget tokens, oldest first, and how many were left out."""
+    kept = []
+    for turn in reversed(turns):
+        cost = estimate_tokens(turn['question']) + estimate_tokens(turn['answer']) + 2 * MESSAGE_OVERHEAD_TOKENS
+        if cost > budget:
+            break
+        budget -= cost
+        kept.append(turn)
+    kept.reverse()
+    return kept, len(turns) - len(kept)
+
+
+def session_to_json(session: Dict[str, Any]) -> Dict[str, Any]:
+    """Public view of a session for the HTTP API."""
+    return {
+        'session_id': session['id'], 'url': session['url'], 'model': session['model'],
+        'context_tokens': session['context_tokens'], 'created_at': session['created_at'],
+        'last_used': session['last_used'], 'idle_ttl': SESSION_IDLE_TTL,
+        'turns': [{'question': turn['question'], 'answer': turn['answer']} for turn in session.get('turns', [])],
+    }
+
+
+session_manager = SessionManager.from_env()
@@ -0,0 +1,121 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Any, TypeVar
+
+try:
+    import fcntl
+except ImportError:  # Windows: cross-worker mode is unavailable
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Directory for cross-worker lock files (e.g. next to PAGE_CACHE_DIR). Unset = coalesce within a process only.
+SINGLEFLIGHT_LOCK_DIR = os.getenv("SINGLEFLIGHT_LOCK_DIR") or None
+SINGLEFLIGHT_LOCK_TIMEOUT = float(os.getenv("SINGLEFLIGHT_LOCK_TIMEOUT", "90"))
+# Keys are hashed into a fixed set of lock files so the directory never grows.
+LOCK_BUCKETS = 1024
+
+T = TypeVar('T')
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: BaseException | None = None
+
+
+class SingleFlight:
+    """Run at most one in-flight call per key; concurrent callers with the same key share its result.
+
+    With a lock directory, the leader also holds a file lock for the key, so a worker
+    process that loses the race waits for the winner and then re-runs ``fn``, which is
+    expected to find the winner's result in a shared cache (disk page cache, SQLite
+    answer cache).
+    """
+
+    def __init__(self, name: str, lock_dir: str | None = SINGLEFLIGHT_LOCK_DIR,
+                 lock_timeout: float = SINGLEFLIGHT_LOCK_TIMEOUT):
+        self.name = name
+        self.lock_dir = lock_dir if fcntl is not None else None
+        self.lock_timeout = lock_timeout
+        self._calls: Dict[str, _Call] = {}
+        self._lock = threading.Lock()
+        self._stats = {'calls': 0, 'executions': 0, 'coalesced': 0, 'cross_worker_waits': 0}
+        if lock_dir and fcntl is None:
+            logger.warning("SINGLEFLIGHT_LOCK_DIR is set but file locks are unavailable on this platform")
+        if self.lock_dir:
+            os.makedirs(self.lock_dir, exist_ok=True)
+
+    def do(self, key: str, fn: Callable[[], T]) -> T:
+        with self._lock:
+            self._stats['calls'] += 1
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self._stats['executions'] += 1
+            else:
+                self._stats['coalesced'] += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            with self._cross_worker_lock(key):
+                call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    @contextmanager
+    def _cross_worker_lock(self, key: str):
+        if not self.lock_dir:
+            yield
+            return
+        bucket = int(hashlib.sha256(key.encode('utf-8')).hexdigest(), 16) % LOCK_BUCKETS
+        fd = os.open(os.path.join(self.lock_dir, f"{self.name}-{bucket}.lock"), os.O_CREAT | os.O_RDWR, 0o644)
+        locked = False
+        try:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                locked = True
+            except BlockingIOError:
+                with self._lock:
+                    self._stats['cross_worker_waits'] += 1
+                deadline = time.monotonic() + self.lock_timeout
+                while not locked and time.monotonic() < deadline:
+                    time.sleep(0.05)
+                    try:
+                        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        locked = True
+                    except BlockingIOError:
+                        pass
+                if not locked:
+                    logger.warning(f"Timed out waiting for another worker on {self.name} key; running anyway")
+            yield
+        finally:
+            if locked:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats, in_flight=len(self._calls))
+        stats['cross_worker'] = bool(self.lock_dir)
+        return stats
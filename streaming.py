@@ -0,0 +1,240 @@
+import codecs
+import logging
+import math
+import os
+import re
+from html.parser import HTMLParser
+from typing import List, Tuple
+
+import requests
+
+from extract import CONTENT_AREA_RULES, UNWANTED_TAGS, UNWANTED_ATTR_MARKERS, TITLE_TAGS, MIN_PARAGRAPH_LENGTH
+
+logger = logging.getLogger(__name__)
+
+SCRAPE_MAX_BYTES = int(os.getenv("SCRAPE_MAX_BYTES", str(10 * 1024 * 1024)))
+SCRAPE_CHUNK_SIZE = int(os.getenv("SCRAPE_CHUNK_SIZE", str(64 * 1024)))
+# Stop downloading once the extractor's budget looks full. Off by default because it is lossy:
+# the extractor spends the budget on every h1-h4 in the page before any paragraph, so headings
+# after the stop point are lost and paragraphs fill their place. A stopped body is also partial,
+# so it is not stored in the page cache (unless the stop fell on the last chunk) and is refetched
+# on every request, and closing the response mid-body drops its pooled keep-alive connection.
+SCRAPE_EARLY_STOP = os.getenv("SCRAPE_EARLY_STOP", "false").lower() == "true"
+STREAM_BUDGET_MARGIN = float(os.getenv("STREAM_BUDGET_MARGIN", "1.5"))
+
+VOID_TAGS = frozenset(['area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'source',
+                       'track', 'wbr'])
+
+_CHARSET_HEADER_RE = re.compile(r'charset\s*=\s*["\']?([\w.:-]+)', re.IGNORECASE)
+_META_CHARSET_RE = re.compile(rb'<meta[^>]+charset\s*=\s*["\']?([\w.:-]+)', re.IGNORECASE)
+_BOMS = [(codecs.BOM_UTF8, 'utf-8-sig'), (codecs.BOM_UTF16_LE, 'utf-16'), (codecs.BOM_UTF16_BE, 'utf-16')]
+
+
+def _valid_encoding(name: str | None) -> str | None:
+    if not name:
+        return None
+    try:
+        return codecs.lookup(name).name
+    except LookupError:
+        return None
+
+
+def _content_area_rank(tag: str, attrs: List[Tuple[str, str | None]]) -> int | None:
+    """Streaming twin of extract._content_area_rank: the element's index in CONTENT_AREA_RULES."""
+    if tag == 'main':
+        return 0
+    if tag == 'article':
+        return 1
+    values = dict(attrs)
+    classes = (values.get('class') or '').split()
+    if values.get('role') == 'main':
+        return 2
+    if 'content' in classes:
+        return 3
+    if values.get('id') == 'content':
+        return 4
+    if 'post-body' in classes:
+        return 5
+    if 'entry-content' in classes:
+        return 6
+    return None
+
+
+def detect_encoding(content_type: str, first_chunk: bytes) -> str:
+    """Pick a charset from the Content-Type header, a BOM, or a <meta> tag in the first 1024 bytes."""
+    match = _CHARSET_HEADER_RE.search(content_type)
+    encoding = _valid_encoding(match.group(1)) if match else None
+    if encoding:
+        return encoding
+    for bom, name in _BOMS:
+        if first_chunk.startswith(bom):
+            return name
+    match = _META_CHARSET_RE.search(first_chunk[:1024])
+    encoding = _valid_encoding(match.group(1).decode('ascii', 'ignore')) if match else None
+    return encoding or 'utf-8'
+
+
+class BudgetMonitor(HTMLParser):
+    """Incremental HTML parser that estimates when ContentExtractor's budget will be full.
+
+    It mirrors the extractor's pruning rules on a token stream and counts headings anywhere,
+    plus paragraphs long enough to be kept inside the first element of each content area
+    rule. The extractor keeps only the highest-priority area's paragraphs, and any later
+    element could outrank the best area seen so far unless that area is a <main>, so the
+    budget only counts as full once the first <main> has filled it.
+    """
+
+    def __init__(self, max_content_length: int, max_paragraphs: int | None = 10,
+                 margin: float = STREAM_BUDGET_MARGIN):
+        super().__init__(convert_charrefs=True)
+        self.char_target = max_content_length * margin
+        self.paragraph_target = math.ceil(max_paragraphs * margin) if max_paragraphs else None
+        self.title_chars = 0
+        # Per CONTENT_AREA_RULES rank, the first matching element: [tag, open depth, chars, paragraphs]
+        self._areas: List[list | None] = [None] * len(CONTENT_AREA_RULES)
+        self._skip_tag: str | None = None
+        self._skip_depth = 0
+        self._capture_tag: str | None = None
+        self._capture_length = 0
+
+    @property
+    def full(self) -> bool:
+        area = self._areas[0]
+        if area is None:
+            return False
+        if self.title_chars + area[2] >= self.char_target:
+            return True
+        return self.paragraph_target is not None and area[3] >= self.paragraph_target
+
+    def _is_unwanted(self, tag: str, attrs: List[Tuple[str, str | None]]) -> bool:
+        if tag in UNWANTED_TAGS:
+            return True
+        for name, value in attrs:
+            if not value:
+                continue
+            if name == 'aria-hidden' and value == 'true':
+                return True
+            if name in ('class', 'id'):
+                if (name == 'id' and value == 'ad') or (name == 'class' and 'ad' in value.split()):
+                    return True
+                if any(marker in value for marker in UNWANTED_ATTR_MARKERS):
+                    return True
+        return False
+
+    def _finish_capture(self) -> None:
+        if self._capture_tag in TITLE_TAGS:
+            self.title_chars += self._capture_length
+        elif self._capture_length > MIN_PARAGRAPH_LENGTH:
+            for area in self._areas:
+                if area is not None and area[1] > 0:
+                    area[2] += self._capture_length
+                    area[3] += 1
+        self._capture_tag = None
+        self._capture_length = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in VOID_TAGS:
+            return
+        if self._skip_tag is not None:
+            if tag == self._skip_tag:
+                self._skip_depth += 1
+            return
+        if self._is_unwanted(tag, attrs):
+            self._skip_tag, self._skip_depth = tag, 1
+            return
+        for area in self._areas:
+            if area is not None and area[1] > 0 and area[0] == tag:
+                area[1] += 1
+        rank = _content_area_rank(tag, attrs)
+        if rank is not None and self._areas[rank] is None:
+            self._areas[rank] = [tag, 1, 0, 0]
+        if tag == 'p' or tag in TITLE_TAGS:
+            if self._capture_tag is not None:
+                self._finish_capture()  # <p> implicitly closes an open paragraph
+            self._capture_tag = tag
+            self._capture_length = 0
+
+    def handle_endtag(self, tag):
+        if self._skip_tag is not None:
+            if tag == self._skip_tag:
+                self._skip_depth -= 1
+                if self._skip_depth == 0:
+                    self._skip_tag = None
+            return
+        if tag == self._capture_tag or (self._capture_tag is not None and any(
+                area is not None and area[1] == 1 and area[0] == tag for area in self._areas)):
+            self._finish_capture()  # Closing an area also closes a paragraph left open inside it
+        for area in self._areas:
+            if area is not None and area[1] > 0 and area[0] == tag:
+                area[1] -= 1
+
+    def handle_data(self, data):
+        if self._skip_tag is None and self._capture_tag is not None:
+            text = data.strip()
+            if text:
+                # +1 approximates the separator get_text(' ') puts between strings
+                self._capture_length += len(text) + (1 if self._capture_length else 0)
+
+
+def _body_consumed(response: requests.Response) -> bool:
+    """Whether every byte of a Content-Length delimited body has already been read off the wire."""
+    length = response.headers.get('Content-Length')
+    tell = getattr(response.raw, 'tell', None)
+    # With a Content-Encoding, decoded bytes can still be buffered after the last wire byte
+    if not length or tell is None or response.headers.get('Content-Encoding', 'identity') != 'identity':
+        return False
+    try:
+        return tell() >= int(length)
+    except (TypeError, ValueError):
+        return False
+
+
+class StreamResult:
+    """Decoded body of a streamed response plus what it cost to download."""
+
+    def __init__(self, text: str, bytes_fetched: int, truncated: bool, stopped_early: bool, encoding: str):
+        self.text = text
+        self.bytes_fetched = bytes_fetched
+        self.truncated = truncated
+        self.stopped_early = stopped_early
+        self.encoding = encoding
+
+
+def read_streamed(response: requests.Response, content_type: str, max_bytes: int = SCRAPE_MAX_BYTES,
+                  monitor: BudgetMonitor | None = None) -> StreamResult:
+    """Read a stream=True response chunk by chunk, decoding incrementally.
+
+    Stops at max_bytes, or when the monitor (if any) reports the content budget full and
+    body remains unread. The response is closed before returning.
+    """
+    parts: List[str] = []
+    decoder = None
+    encoding = 'utf-8'
+    bytes_fetched = 0
+    truncated = stopped_early = False
+    try:
+        for chunk in response.iter_content(chunk_size=SCRAPE_CHUNK_SIZE):
+            if not chunk:
+                continue
+            if decoder is None:
+                encoding = detect_encoding(content_type, chunk)
+                decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+            if bytes_fetched + len(chunk) > max_bytes:
+                chunk = chunk[:max_bytes - bytes_fetched]
+                truncated = True
+            bytes_fetched += len(chunk)
+            text = decoder.decode(chunk)
+            parts.append(text)
+            if truncated:
+                break
+            if monitor is not None:
+                monitor.feed(text)
+                if monitor.full:
+                    # A stop on the last chunk still has the whole page, which can then be cached
+                    stopped_early = not _body_consumed(response)
+                    break
+        if decoder is not None:
+            parts.append(decoder.decode(b'', final=True))
+    finally:
+        response.close()
+    return StreamResult(''.join(parts), bytes_fetched, truncated, stopped_early, encoding)
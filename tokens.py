@@ -0,0 +1,36 @@
+import math
+
+# Average characters per token for English text under BPE tokenizers (GPT, Llama, Gemini are all close).
+CHARS_PER_TOKEN = 4
+# Estimates err high so prompts stay under the real limit.
+SAFETY_FACTOR = 1.1
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap local token estimate: ~4 ASCII chars per token, ~1 token per non-ASCII char.
+
+    Runs in C-level string operations only, so it is safe to call per chunk on large pages.
+    """
+    if not text:
+        return 0
+    ascii_chars = len(text.encode('ascii', 'ignore'))
+    non_ascii_chars = len(text) - ascii_chars
+    return math.ceil((ascii_chars / CHARS_PER_TOKEN + non_ascii_chars) * SAFETY_FACTOR)
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut text so that estimate_tokens(result) <= max_tokens, preferring a word boundary."""
+    if max_tokens <= 0:
+        return ''
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    low, high = 0, len(text)
+    while low < high:  # Binary search on the prefix length
+        mid = (low + high + 1) // 2
+        if estimate_tokens(text[:mid]) <= max_tokens:
+            low = mid
+        else:
+            high = mid - 1
+    cut = text[:low]
+    space = cut.rfind(' ')
+    return cut[:space] if space > low * 0.8 else cut